@@ -0,0 +1 @@
+# Lets pytest import gpsrenda from this checkout, without installing it.
@@ -0,0 +1,187 @@
+"""
+Benchmarks for overlay rendering, independent of any video engine.
+
+We render a layout's widgets, frame after frame, into an offscreen cairo
+surface, and time each widget separately, so that a regression in one of
+the widgets' hot paths shows up as that widget getting slower, rather than
+as a slightly lower number at the end of a long render.  The activity data
+can come from a real FIT file, or from synthetic_ride(), which makes up a
+ride with every field that the widgets know how to show.
+"""
+
+import logging
+import math
+import time
+import tracemalloc
+from datetime import datetime
+
+import cairo
+import numpy as np
+
+from gpsrenda.datasources import FitDataSource, ParsedFitData, PrecomputedDataSource
+from gpsrenda.globals import globals
+from gpsrenda.utils import timestamp_to_seconds
+from gpsrenda.widgets.overlay import Overlay
+
+logger = logging.getLogger(__name__)
+
+# The resolution that layouts are written for.
+LAYOUT_WIDTH = 1920
+
+def synthetic_ride(duration = 2 * 60 * 60, start = datetime(2021, 6, 1, 8, 0, 0)):
+    """Makes up a ParsedFitData for a ride of `duration` seconds, with one
+    record per second: a loop around a hilly course, with speed, power,
+    and so on that wander around, a couple of stops, and a new lap every
+    ten minutes."""
+    t0 = timestamp_to_seconds(start)
+    t = np.arange(duration, dtype=float)
+    phase = 2 * math.pi * t / duration
+
+    speed = 7 + 2 * np.sin(t / 97) + np.sin(t / 13)
+    # Stand still for a couple of minutes every so often.
+    stopped = (t % 1800) > 1680
+    speed[stopped] = 0
+    distance = np.cumsum(speed)
+
+    altitude = 200 + 80 * np.sin(phase * 3) + 15 * np.sin(t / 50)
+    ascent = np.cumsum(np.maximum(np.diff(altitude, prepend = altitude[0]), 0))
+
+    # A loop about 10km across, in semicircles, like FIT files have.
+    lat = (37.4 + 0.05 * np.sin(phase)) * 2**32 / 360
+    lon = (-122.1 + 0.06 * np.cos(phase)) * 2**32 / 360
+
+    cadence = np.where(stopped, 0, 88 + 6 * np.sin(t / 31))
+    power = np.where(stopped, 0, 180 + 60 * np.sin(t / 23) + 40 * np.sin(phase * 3))
+    heart_rate = 130 + 20 * np.sin(t / 300) + 10 * np.sin(phase * 3)
+    temperature = 18 + 6 * np.sin(phase / 2)
+
+    parsed = ParsedFitData.__new__(ParsedFitData)
+    parsed.version = ParsedFitData.VERSION
+    parsed.cache_key = None
+    parsed.file_id = { 'manufacturer': 'development', 'product': 0 }
+    parsed.fields = {
+        name: np.stack([ t0 + t, values ], axis = 1) for name, values in {
+            'speed': speed,
+            'distance': distance,
+            'altitude': altitude,
+            'ascent': ascent,
+            'position_lat': lat,
+            'position_long': lon,
+            'cadence': cadence,
+            'power': power,
+            'heart_rate': heart_rate,
+            'temperature': temperature,
+        }.items()
+    }
+    laps = np.arange(0, duration, 600, dtype=float)
+    parsed.fields['lap'] = np.stack([ t0 + laps, np.arange(1, len(laps) + 1) ], axis = 1)
+    return parsed
+
+def synthetic_data_source(config = None, duration = 2 * 60 * 60):
+    """A FitDataSource for synthetic_ride()."""
+    return FitDataSource(None, config = config or {}, parsed = synthetic_ride(duration))
+
+class WidgetTimer:
+    """Accumulates per-frame timings for one widget."""
+    def __init__(self, name):
+        self.name = name
+        self.times = []
+        self.peak_alloc = 0
+
+    def summary(self):
+        times = np.array(self.times) * 1e6
+        return {
+            'name': self.name,
+            'mean_us': float(np.mean(times)),
+            'p50_us': float(np.percentile(times, 50)),
+            'p95_us': float(np.percentile(times, 95)),
+            'max_us': float(np.max(times)),
+            'peak_alloc_kb': self.peak_alloc / 1024,
+        }
+
+def _widget_name(widget):
+    return type(widget).__name__.replace('Widget', '')
+
+def benchmark(widget_specs, data_source, width = 1920, height = 1080, frames = 600, framerate = 30000/1001, start = None, trace_allocations = True):
+    """Renders `frames` frames of the overlay described by `widget_specs`
+    (the `widgets` section of a config file) into an offscreen surface of
+    `width` x `height`, starting at FIT time `start` (by default, a minute
+    into the activity).  Returns a dict of results: per-widget timings
+    (in microseconds per frame) and peak allocations, and the total time
+    per frame and frame rate."""
+    if start is None:
+        start = min(values[0, 0] for values in data_source.fields.values() if len(values) > 0) + 60
+
+    # Render from a precomputed timeline, like a real render does.
+    precomputed = PrecomputedDataSource(data_source)
+    precomputed.precompute(start, frames / framerate, framerate)
+
+    # Layouts are written for 1080p; draw the widgets' tiles at the size
+    # that they are shown at, as a draft render does.
+    overlay_scale = globals['style']['overlay_scale']
+    globals['style']['overlay_scale'] = width / LAYOUT_WIDTH
+    try:
+        return _benchmark(widget_specs, precomputed, width, height, frames, framerate, start, trace_allocations)
+    finally:
+        globals['style']['overlay_scale'] = overlay_scale
+
+def _benchmark(widget_specs, precomputed, width, height, frames, framerate, start, trace_allocations):
+    tst = time.perf_counter()
+    overlay = Overlay.from_config(widget_specs, precomputed)
+    setup_time = time.perf_counter() - tst
+
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+    ctx = cairo.Context(surface)
+
+    timers = [ WidgetTimer(_widget_name(widget)) for widget in overlay.widgets ]
+    frame_times = []
+    for k in range(frames):
+        t = start + k / framerate
+        fst = time.perf_counter()
+        ctx.save()
+        ctx.set_operator(cairo.OPERATOR_CLEAR)
+        ctx.paint()
+        ctx.restore()
+        for widget, timer in zip(overlay.widgets, timers):
+            wst = time.perf_counter()
+            widget.render(ctx, t)
+            timer.times.append(time.perf_counter() - wst)
+        surface.flush()
+        frame_times.append(time.perf_counter() - fst)
+
+    if trace_allocations:
+        # tracemalloc slows everything down a lot, so do this on a separate
+        # pass over the same frames, rather than while we are timing.
+        overlay = Overlay.from_config(widget_specs, precomputed)
+        tracemalloc.start()
+        for k in range(frames):
+            t = start + k / framerate
+            for widget, timer in zip(overlay.widgets, timers):
+                tracemalloc.reset_peak()
+                (before, _) = tracemalloc.get_traced_memory()
+                widget.render(ctx, t)
+                (_, peak) = tracemalloc.get_traced_memory()
+                timer.peak_alloc = max(timer.peak_alloc, peak - before)
+        tracemalloc.stop()
+
+    frame_times = np.array(frame_times)
+    return {
+        'width': width,
+        'height': height,
+        'frames': frames,
+        'setup_ms': setup_time * 1e3,
+        'widgets': [ timer.summary() for timer in timers ],
+        'frame_mean_us': float(np.mean(frame_times) * 1e6),
+        'frame_p95_us': float(np.percentile(frame_times, 95) * 1e6),
+        'fps': float(frames / np.sum(frame_times)),
+    }
+
+def format_results(results):
+    """Formats the result of benchmark() as a table."""
+    lines = [ f"{results['width']}x{results['height']}, {results['frames']} frames (widget setup {results['setup_ms']:.0f} ms):" ]
+    lines.append(f"  {'widget':<20} {'mean µs':>9} {'p50 µs':>9} {'p95 µs':>9} {'max µs':>9} {'peak KB':>9}")
+    for w in results['widgets']:
+        lines.append(f"  {w['name']:<20} {w['mean_us']:>9.1f} {w['p50_us']:>9.1f} {w['p95_us']:>9.1f} {w['max_us']:>9.1f} {w['peak_alloc_kb']:>9.1f}")
+    lines.append(f"  {'total':<20} {results['frame_mean_us']:>9.1f} {'':>9} {results['frame_p95_us']:>9.1f} {'':>9} {'':>9}  ({results['fps']:.1f} fps)")
+    return "\n".join(lines)
+
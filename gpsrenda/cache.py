@@ -0,0 +1,70 @@
+"""
+A shared, content-addressed cache directory for data that is slow to
+compute (e.g., parsed FIT files).  Entries are named by a key that the
+caller derives from the content they were computed from, so the cache can
+live on a volume shared between machines; it is kept under a size cap by
+evicting the least recently used entries.
+"""
+
+import hashlib
+import logging
+import os
+
+from gpsrenda.globals import globals
+
+logger = logging.getLogger(__name__)
+
+def cache_dir():
+    """Returns the configured cache directory, creating it if need be."""
+    path = globals['cache']['dir']
+    if path is None:
+        path = os.environ.get('GPSRENDA_CACHE_DIR', None)
+    if path is None:
+        path = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'gpsrenda')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def file_digest(path):
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def touch(path):
+    """Marks a cache entry as recently used."""
+    try:
+        os.utime(path)
+    except OSError:
+        # Read-only cache volumes are fine; we just cannot track use.
+        pass
+
+def evict(directory, suffix, max_bytes, keep = None):
+    """Deletes the least recently used entries ending in `suffix` from
+    `directory` until they total no more than `max_bytes` (never deleting
+    `keep`)."""
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith(suffix):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if keep is not None and os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        try:
+            os.unlink(path)
+            logger.debug(f"evicted {path} from cache ({size / 1024 / 1024:.1f} MB)")
+        except FileNotFoundError:
+            # Someone else got to it first.
+            pass
+        total -= size
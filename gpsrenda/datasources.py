@@ -1,16 +1,26 @@
 import fitparse
 import numpy as np
 import math
-import pickle
+import json
+import os
+import struct
+import tempfile
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from functools import partial
 
 from datetime import datetime, timedelta
 import logging
 
+import gpsrenda.cache
+from gpsrenda.globals import globals
 from gpsrenda.utils import timestamp_to_seconds, seconds_to_timestamp, merge_dict
 
 logger = logging.getLogger(__name__)
 
+CACHE_SUFFIX = ".gpsrendacache"
+
 DEFAULT_DATA_CONFIG = {
     'altitude': {
         'lag': 0
@@ -53,66 +63,278 @@ def interp1d_zeroing(x, y, t, flatten_time = math.inf):
     alpha = (t - pre[0]) / (post[0] - pre[0])
     return pre[1] * (1.0 - alpha) + post[1] * alpha
 
+def interp1d_zeroing_array(x, y, t, flatten_time = math.inf):
+    """Vectorized interp1d_zeroing: evaluates every element of the array t
+    in one pass, with exactly the same edge cases as the scalar version."""
+    t = np.asarray(t, dtype=float)
+    out = np.full(t.shape, math.nan)
+
+    inside = (t >= x[0]) & (t <= x[-1])
+    ti = t[inside]
+
+    argt = np.searchsorted(x, ti) # x[argt] >= t
+    at_start = argt == 0
+    # Keep both neighbours in range even if x is a single sample (when every
+    # t inside is x[0], and at_start covers it).
+    argt = np.minimum(np.maximum(argt, 1), len(x) - 1)
+
+    pre_x, pre_y = x[argt-1], y[argt-1]
+    post_x, post_y = x[argt], y[argt]
+
+    # do we need to flatten?
+    flatten_pre = (ti - pre_x) > flatten_time
+    flatten_post = (post_x - ti) > flatten_time
+    pre_x, pre_y = np.where(flatten_pre, post_x - flatten_time, pre_x), np.where(flatten_pre, 0.0, pre_y)
+    post_x, post_y = np.where(flatten_post, x[argt-1] + flatten_time, post_x), np.where(flatten_post, 0.0, post_y)
+
+    # do the lerp
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        alpha = (ti - pre_x) / (post_x - pre_x)
+        val = pre_y * (1.0 - alpha) + post_y * alpha
+    val = np.where(post_x < pre_x, 0.0, val) # we are flattening both
+    val = np.where(at_start, y[0], val)
+
+    out[inside] = val
+    return out
+
+class _FieldColumn:
+    """A growable column of (time, value) samples for one FIT field, stored
+    as a flat typed array of doubles rather than as Python tuples."""
+
+    def __init__(self, name):
+        # fitparse gets this wrong, and maps 0% right to 'right'.
+        self.fix_balance = "left_right_balance" in name
+        self.samples = array('d')
+
+    def append(self, time, value):
+        """Adds a sample; returns False if the value is not numeric."""
+        if self.fix_balance and value == 'right':
+            value = 0x80
+        if value is None:
+            value = math.nan
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return False
+        self.samples.append(time)
+        self.samples.append(value)
+        return True
+
+    def array(self):
+        return np.frombuffer(self.samples, dtype=float).reshape(-1, 2)
+
 class ParsedFitData:
     """
-    Loading large FIT files can be very slow, so we create a pickleable
-    ParsedFitData structure that can be used to create a cache later.
+    Loading large FIT files can be very slow, so we create a ParsedFitData
+    structure that can be used to create a cache later.  Each field is an
+    (N, 2) float array of (time, value) rows.
+
+    The cache is columnar: a small JSON header, followed by raw float64
+    columns (for each field, its time column and then its value column).
+    Loading it memory-maps the columns rather than reading them, so even a
+    multi-day ride opens instantly and only pages in what gets used.
     """
 
     # Bump this every time you change anything in ParsedFitData.
-    VERSION = 2
+    VERSION = 4
+
+    CACHE_MAGIC = b"GPSRENDA"
+    CACHE_ALIGN = 64
     
     DEDUP = { 'ascent': True }
 
     def __init__(self, file_path):
         self.version = ParsedFitData.VERSION
+        self.cache_key = None # set by load_fit_data
 
         fit_file = fitparse.FitFile(file_path)
 
-        self.file_id = list(fit_file.get_messages('file_id'))[0].get_values()
-
-        messages = list(fit_file.get_messages('record'))
-        self.fields = {}
+        self.file_id = {}
+        columns = {}
+        dropped = set()
+        last_values = {}
         queued_fields = {}
-        for message in messages:
-            data = message.get_values()
-            time = timestamp_to_seconds(data.pop('timestamp'))
-            for key, value in data.items():
-                try:
-                    if key not in ParsedFitData.DEDUP:
-                        self.fields[key].append((time, value))
-                    else:
-                        if self.fields[key][-1][1] == value:
-                            queued_fields[key] = (time, value)
-                        else:
-                            del queued_fields[key]
-                            self.fields[key].append((time, value))
-                except KeyError:
-                    self.fields[key] = [(time, value)]
-        for key, value in queued_fields.items():
-            self.fields[key].append(value)
-        self.fields['lap'] = []
+        laps = _FieldColumn('lap')
         lapn = 1
         end_lap = None
-        for message in list(fit_file.get_messages('lap')):
+
+        # fitparse holds on to every message that it has ever parsed, in a
+        # private list; we take what we need from each one as it goes by,
+        # so we can let them go.  If some other version of fitparse keeps
+        # them elsewhere, we just parse the usual way.
+        parsed_messages = getattr(fit_file, '_messages', None)
+        if not isinstance(parsed_messages, list):
+            logger.debug("cannot release fitparse's parsed messages; parsing the whole file into memory")
+            parsed_messages = None
+
+        # One pass over the file, handling each message as fitparse yields
+        # it, rather than building lists of all of the records and laps.
+        for message in fit_file.get_messages(['file_id', 'record', 'lap']):
             data = message.get_values()
-            self.fields['lap'].append((timestamp_to_seconds(data.pop('start_time')), lapn))
-            lapn += 1
-            end_lap = (timestamp_to_seconds(data.pop('timestamp')), lapn)
+            if message.name == 'file_id':
+                if not self.file_id:
+                    self.file_id = data
+            elif message.name == 'record':
+                time = timestamp_to_seconds(data.pop('timestamp'))
+                for key, value in data.items():
+                    if key in dropped:
+                        continue
+                    if key not in columns:
+                        columns[key] = _FieldColumn(key)
+                    if key in ParsedFitData.DEDUP:
+                        if key in last_values and last_values[key] == value:
+                            queued_fields[key] = (time, value)
+                            continue
+                        queued_fields.pop(key, None)
+                        last_values[key] = value
+                    if not columns[key].append(time, value):
+                        logger.debug(f"dropping non-numeric FIT field {key}")
+                        dropped.add(key)
+                        del columns[key]
+            elif message.name == 'lap':
+                laps.append(timestamp_to_seconds(data.pop('start_time')), lapn)
+                lapn += 1
+                end_lap = (timestamp_to_seconds(data.pop('timestamp')), lapn)
+
+            if parsed_messages is not None:
+                del parsed_messages[:]
+
+        for key, (time, value) in queued_fields.items():
+            if key in columns:
+                columns[key].append(time, value)
         if end_lap:
-            self.fields['lap'].append(end_lap)
+            laps.append(*end_lap)
+        columns['lap'] = laps
+
+        self.fields = { key: column.array() for key, column in columns.items() }
 
     def save_cache(self, cache_path):
-        with open(cache_path, "wb") as f:
-            pickle.dump(self, f)
+        columns = []
+        offset = 0
+        for name, values in self.fields.items():
+            columns.append([name, offset, len(values)])
+            offset += 2 * len(values)
+        header = json.dumps({
+            'version': self.version,
+            'file_id': self.file_id,
+            'columns': columns,
+        }, default=str).encode('utf-8')
+
+        # Write to a temporary file next to the cache, and then atomically
+        # move it into place, so that a concurrent render never sees a
+        # half-written cache.
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(cache_path) + ".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(cache_path)))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(ParsedFitData.CACHE_MAGIC)
+                f.write(struct.pack("<Q", len(header)))
+                f.write(header)
+                f.write(b"\0" * (-f.tell() % ParsedFitData.CACHE_ALIGN))
+                for name, values in self.fields.items():
+                    values[:, 0].astype('<f8').tofile(f)
+                    values[:, 1].astype('<f8').tofile(f)
+            os.replace(tmp_path, cache_path)
+        except:
+            os.unlink(tmp_path)
+            raise
 
     @classmethod
     def load_cache(cls, cache_path):
+        """Loads a cache written by save_cache().  Raises ValueError if it
+        is not one, or is truncated, or is from another VERSION."""
+        try:
+            return cls._load_cache(cache_path)
+        except (struct.error, KeyError, TypeError, UnicodeDecodeError) as e:
+            raise ValueError(f"{cache_path} is truncated or corrupt ({type(e).__name__}: {e})")
+
+    @classmethod
+    def _load_cache(cls, cache_path):
         with open(cache_path, "rb") as f:
-            self = pickle.load(f)
-            if self.version != ParsedFitData.VERSION:
-                raise ValueError("incorrect cache version f{self.version} (want f{ParsedFitData.VERSION}) in file f{cache_path}")
-            return self
+            if f.read(len(ParsedFitData.CACHE_MAGIC)) != ParsedFitData.CACHE_MAGIC:
+                raise ValueError(f"{cache_path} is not a gpsrenda cache file")
+            (header_len, ) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_len).decode('utf-8'))
+            data_offset = f.tell() + (-f.tell() % ParsedFitData.CACHE_ALIGN)
+            file_size = os.fstat(f.fileno()).st_size
+
+        if header['version'] != ParsedFitData.VERSION:
+            raise ValueError(f"incorrect cache version {header['version']} (want {ParsedFitData.VERSION}) in file {cache_path}")
+
+        self = cls.__new__(cls)
+        self.version = header['version']
+        self.cache_key = None
+        self.file_id = header['file_id']
+        self.fields = {}
+
+        nvalues = sum(2 * nrows for _, _, nrows in header['columns'])
+        if data_offset + 8 * nvalues > file_size:
+            raise ValueError(f"{cache_path} is truncated")
+        if nvalues > 0:
+            data = np.memmap(cache_path, dtype='<f8', mode='r', offset=data_offset, shape=(nvalues, ))
+        for name, offset, nrows in header['columns']:
+            if nrows == 0:
+                self.fields[name] = np.empty((0, 2))
+                continue
+            # Transposing the (2, N) block gives (time, value) rows, while
+            # each column stays contiguous in the mapping.
+            self.fields[name] = data[offset:offset + 2 * nrows].reshape(2, nrows).T
+        return self
+
+def load_fit_data(file_path, cache_dir = None):
+    """Returns the ParsedFitData for a FIT file, from the cache if possible,
+    and parsing it (and adding it to the cache) otherwise.  Cache entries
+    are keyed by the FIT file's contents and ParsedFitData.VERSION, so
+    they can be shared between machines."""
+    start = time.time()
+    if cache_dir is None:
+        cache_dir = gpsrenda.cache.cache_dir()
+    key = f"{gpsrenda.cache.file_digest(file_path)}-v{ParsedFitData.VERSION}"
+    cache_name = os.path.join(cache_dir, f"{key}{CACHE_SUFFIX}")
+
+    try:
+        parsed = ParsedFitData.load_cache(cache_name)
+        parsed.cache_key = key
+        gpsrenda.cache.touch(cache_name)
+        logger.info(f"FIT cache hit for {file_path} (key {key}, {time.time() - start:.2f}s)")
+        return parsed
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.warning(f"FIT cache entry {cache_name} is unreadable ({e}); ignoring it")
+
+    parsed = ParsedFitData(file_path)
+    parsed.cache_key = key
+    logger.info(f"FIT cache miss for {file_path} (key {key}); parsed in {time.time() - start:.1f}s")
+    try:
+        parsed.save_cache(cache_name)
+        gpsrenda.cache.evict(cache_dir, CACHE_SUFFIX, globals['cache']['max_size_mb'] * 1024 * 1024, keep = cache_name)
+    except OSError as e:
+        logger.warning(f"could not write FIT cache entry {cache_name}: {e}")
+    return parsed
+
+def _warm_cache(file_path, cache_dir):
+    start = time.time()
+    load_fit_data(file_path, cache_dir = cache_dir)
+    return time.time() - start
+
+def warm_caches(file_paths, jobs = None):
+    """Makes sure that every FIT file in `file_paths` has a cache, parsing
+    the ones that do not in parallel in a pool of `jobs` processes (by
+    default, one per CPU).  Returns a dict mapping each path to either the
+    number of seconds it took, or the exception that it raised."""
+    results = {}
+    cache_dir = gpsrenda.cache.cache_dir()
+    with ProcessPoolExecutor(max_workers = jobs) as pool:
+        futures = { pool.submit(_warm_cache, path, cache_dir): path for path in file_paths }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                results[path] = future.result()
+                logger.info(f"cached {path} in {results[path]:.1f}s")
+            except Exception as e:
+                logger.error(f"failed to cache {path}: {e}")
+                results[path] = e
+    return results
 
 class FitDataSource:
     GARMIN530_QUIRKS = {
@@ -143,17 +365,31 @@ class FitDataSource:
         ( { 'manufacturer': 'lezyne', 'product': 11 }, { 'name': 'Lezyne Mega XL', 'quirks': LEZYNE_QUIRKS }),
     ]
 
-    def __init__(self, file_path, config):
-        cache_name = f"{file_path}.gpsrendacache"
-        try:
-            logger.debug(f"trying to load FIT cache from {cache_name}")
-            parsed = ParsedFitData.load_cache(cache_name)
-        except:
-            logger.info(f"could not load from FIT cache {cache_name}; loading FIT file the hard way (this may take a moment)")
-            parsed = ParsedFitData(file_path)
-            parsed.save_cache(cache_name)
+    # Channels that sample() knows how to evaluate, mapped to the FIT field
+    # they come from, the config section whose lag applies to them (if
+    # any), and whether gaps get flattened to zero.  'grade' and 'lap' are
+    # special-cased, just like their scalar accessors.
+    CHANNELS = {
+        'altitude':    ('altitude',      'altitude', False),
+        'ascent':      ('ascent',        'altitude', False),
+        'cadence':     ('cadence',       None,       True),
+        'distance':    ('distance',      'position', False),
+        'heart_rate':  ('heart_rate',    None,       False),
+        'lat':         ('position_lat',  'position', False),
+        'lon':         ('position_long', 'position', False),
+        'power':       ('power',         None,       True),
+        'speed':       ('speed',         'position', True),
+        'temperature': ('temperature',   None,       False),
+    }
+
+    def __init__(self, file_path, config, parsed = None):
+        # `parsed` lets a caller hand us a ParsedFitData that did not come
+        # from a file (e.g., gpsrenda.bench's synthetic rides).
+        if parsed is None:
+            parsed = load_fit_data(file_path)
 
         self.fields = parsed.fields
+        self.cache_key = parsed.cache_key
 
         # Apply quirks as early as possible.
         self.config = DEFAULT_DATA_CONFIG
@@ -175,15 +411,15 @@ class FitDataSource:
         mintime = math.inf
 
         self._interpolators = {}
-        for name, values in parsed.fields.items():
-            # fitparse gets this wrong, and maps 0% right to 'right'.
-            if "left_right_balance" in name:
-                values = [ (t, 0x80 if v == 'right' else v) for t,v in values ]
-            
-            if len(values) > 0 and values[0][0] < mintime:
-                mintime = values[0][0]
-
-            val_array = np.array(values, dtype=float)
+        self._series = {}
+        for name, val_array in parsed.fields.items():
+            if len(val_array) == 0:
+                logger.debug(f"{name} data is empty")
+                continue
+
+            if val_array[0,0] < mintime:
+                mintime = val_array[0,0]
+
             # It is possible for the fit file to contain a few or all NaNs due to missing / corrupted data
             # Drop nans before interpolation
             nans = np.isnan(val_array[:,1])
@@ -196,12 +432,58 @@ class FitDataSource:
                     if len(nan_idx) > 10:
                         times_str += ", ..."
                     logger.warn(f"Found {len(nan_idx):d} NaN(s) in {name} data at {times_str:s}")
-                not_nan_idx, = np.where(np.logical_not(nans))
-                x, y = val_array[not_nan_idx,0], val_array[not_nan_idx,1]
+                    not_nan_idx, = np.where(np.logical_not(nans))
+                    x, y = val_array[not_nan_idx,0], val_array[not_nan_idx,1]
+                else:
+                    # No copy needed; keep using the cache's mapping.
+                    x, y = val_array[:,0], val_array[:,1]
                 self._interpolators[name] = partial(interp1d_zeroing, x, y)
+                self._series[name] = (x, y)
         
         logger.debug(f"FIT file starts at {seconds_to_timestamp(mintime)} (ts = {mintime:.0f})")
 
+    def _sample_channel(self, name, times):
+        field, lag, flatten = FitDataSource.CHANNELS[name]
+        x, y = self._series[field]
+        if lag is not None:
+            times = times + self.config[lag]['lag']
+        return interp1d_zeroing_array(x, y, times, flatten_time = self.config['gap_flatten_time'] if flatten else math.inf)
+
+    def _sample_grade(self, times):
+        if 'grade' in self._series:
+            x, y = self._series['grade']
+            return interp1d_zeroing_array(x, y, times, flatten_time = self.config['gap_flatten_time'])
+
+        dt = self.config['grade']['averaging_time'] / 2
+        lag = self.config['altitude']['lag']
+        den = self._sample_channel('distance', times + dt) - self._sample_channel('distance', times - dt)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            result = (self._sample_channel('altitude', times + dt + lag) - self._sample_channel('altitude', times - dt + lag)) / den * 100
+        return np.where(den < self.config['grade']['min_distance'], 0.0, result)
+
+    def sample(self, fields, times):
+        """Evaluates many channels at once for a whole array of times.
+
+        `fields` is an iterable of channel names -- the same names as the
+        scalar accessors (e.g., 'speed', 'lat', 'grade') -- and `times` is
+        an array of timestamps in FIT seconds.  Returns a dict mapping each
+        channel name to an array of the same shape as `times`, with exactly
+        the values that calling the scalar accessor on each element would
+        have returned.  Like the scalar accessors, raises KeyError if the
+        FIT file has no data for a requested channel."""
+        times = np.asarray(times, dtype=float)
+        result = {}
+        for name in fields:
+            if name == 'grade':
+                result[name] = self._sample_grade(times)
+            elif name == 'lap':
+                x, y = self._series['lap']
+                laps = interp1d_zeroing_array(x, y, times)
+                result[name] = np.where(np.isnan(laps), 0, np.floor(laps)).astype(int)
+            else:
+                result[name] = self._sample_channel(name, times)
+        return result
+
     def altitude(self, t):
         return self._interpolators['altitude'](t + self.config['altitude']['lag'])
 
@@ -250,3 +532,89 @@ class FitDataSource:
 
     def temperature(self, t):
         return self._interpolators['temperature'](t)
+
+class PrecomputedDataSource:
+    """
+    Wraps a FitDataSource with a columnar table of every channel, sampled
+    once per frame for a whole clip.  Widgets use this exactly as they would
+    use a FitDataSource; inside the precomputed range, each accessor is just
+    an index into the table, rather than a trip through the interpolators.
+    Outside of it (or before precompute() is called), calls fall through to
+    the underlying FitDataSource.
+    """
+
+    def __init__(self, data_source):
+        self.data_source = data_source
+        self.columns = {}
+        self.start = 0.0
+        self.framerate = 1.0
+        self.nframes = 0
+
+    def __getattr__(self, name):
+        # Anything we do not precompute (fields, config, ...) comes from the
+        # real data source.
+        if name == 'data_source':
+            raise AttributeError(name)
+        return getattr(self.data_source, name)
+
+    def precompute(self, start, duration, framerate):
+        """Samples every available channel at `start + k / framerate` for
+        each frame k in a clip of `duration` seconds."""
+        self.start = start
+        self.framerate = framerate
+        self.nframes = int(math.ceil(duration * framerate)) + 1
+        times = start + np.arange(self.nframes) / framerate
+
+        self.columns = {}
+        for name in list(FitDataSource.CHANNELS) + ['grade', 'lap']:
+            try:
+                self.columns.update(self.data_source.sample([name], times))
+            except KeyError:
+                # The scalar accessor will raise for this, too, if a
+                # widget actually asks for it.
+                pass
+        logger.debug(f"precomputed {len(self.columns)} channels for {self.nframes} frames at {framerate:.3f} fps")
+
+    def _lookup(self, name, t):
+        # The table is a uniform grid, so the nearest row is at most half a
+        # frame away from t.
+        idx = int(round((t - self.start) * self.framerate))
+        if 0 <= idx < self.nframes and name in self.columns:
+            return self.columns[name][idx]
+        return getattr(self.data_source, name)(t)
+
+    def altitude(self, t):
+        return self._lookup('altitude', t)
+
+    def ascent(self, t):
+        return self._lookup('ascent', t)
+
+    def cadence(self, t):
+        return self._lookup('cadence', t)
+
+    def distance(self, t):
+        return self._lookup('distance', t)
+
+    def grade(self, t):
+        return self._lookup('grade', t)
+
+    def heart_rate(self, t):
+        return self._lookup('heart_rate', t)
+
+    def lap(self, t):
+        return self._lookup('lap', t)
+
+    def lat(self, t):
+        return self._lookup('lat', t)
+
+    def lon(self, t):
+        return self._lookup('lon', t)
+
+    def power(self, t):
+        return self._lookup('power', t)
+
+    def speed(self, t):
+        return self._lookup('speed', t)
+
+    def temperature(self, t):
+        return self._lookup('temperature', t)
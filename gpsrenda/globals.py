@@ -18,19 +18,33 @@ globals = {
           'dummy_value': None,
           'dummy_caption': 'mph',
         },
+        'overlay_scale': 1.0, # draw the widgets this much bigger (or smaller) than the config file lays them out; draft renders shrink them along with the video
     },
     'units': 'metric',
+    'profile': False, # record per-stage timings during renders, and write them out as JSON next to each output
+    'cache': {
+        'dir': None, # defaults to $GPSRENDA_CACHE_DIR, or ~/.cache/gpsrenda
+        'max_size_mb': 2048,
+    },
     'video': {
         'force_rotation': None,
         'engine': None,
         'scale': None,
+        'scale_factor': 1.0, # scale the video by this much more, after any 'scale' (draft renders use this)
         'gstreamer': {
-            'h265': False,
+            'h265': False, # only used if we cannot read the codec out of the file
             'pcm_audio': False,
-            'framerate': 30000/1001,
+            'framerate': 30000/1001, # only used if we cannot read the frame rate out of the file
             'speed_preset': 'veryfast',
             'bitrate': 60000,
             'encode_threads': 4,
+            'decode_threads': 6, # for the software decoder
+            'queue_size_mb': 100, # how much decoded video to buffer ahead of the overlay
+            'overlay_threads': 0, # if nonzero, prerender the overlay for upcoming frames on this many threads
+            'checkpoint_interval': 0, # if nonzero, write the output in fragments of about this many seconds, so that an interrupted render can resume
+            'segments': 1, # split each clip into this many pieces, and render them in parallel processes (0 for one per CPU)
+            'overlay_compositing': 'cpu', # 'cpu' draws the overlay into each decoded frame; 'gl' composites it with OpenGL, so that frames decoded into GL memory can stay there; 'meta' attaches it to each frame as overlay composition metadata, for gloverlaycompositor to blend in
+            'overlay_format': 'qtrle', # for overlay-only renders: 'qtrle' (.mov with alpha), 'png' (a directory of PNGs), or 'sparse' (only the distinct PNGs, plus a manifest)
             'decoder': None,
             'encoder': 'x264', # x264 is actually just as fast on my machine as the hardware encoder ... and the video quality is a lot better for ~ the same bitrate
             'x264_profile': 'high', # yuv420, for youtube and davinci resolve compatibility... can also be high-4:2:2, high-4:4:4, baseline, ...
@@ -0,0 +1,83 @@
+"""
+The build manifest that renda keeps next to its outputs (in each
+`rendered/` directory), so that rerunning it over a ride only renders the
+clips whose inputs have changed.
+
+For each output, the manifest records a fingerprint of everything that
+went into it -- the config file, the activity data (by its FIT cache key),
+the clip's own settings from the config, and the size and modification
+time of the source video -- and whether the render finished.
+"""
+
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".gpsrenda-manifest.json"
+VERSION = 1
+
+def fingerprint(config_digest, fit_cache_key, video_config, video_path, mode):
+    """Returns a description of all of the inputs to one render, which can
+    be compared against the one recorded in the manifest."""
+    st = os.stat(video_path)
+    return {
+        'config': config_digest,
+        'fit': fit_cache_key,
+        # Round-trip through JSON, so that this compares equal to what we
+        # read back from the manifest.
+        'video': json.loads(json.dumps(video_config, sort_keys=True, default=str)),
+        'source': { 'size': st.st_size, 'mtime': st.st_mtime },
+        'mode': mode,
+    }
+
+class Manifest:
+    def __init__(self, directory):
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self.entries = {}
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            if data.get('version') == VERSION:
+                self.entries = data['entries']
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"build manifest {self.path} is unreadable ({e}); rendering everything")
+
+    def up_to_date(self, name, inputs):
+        """Whether the output for `name` was completely rendered from
+        exactly these inputs, and is still there."""
+        entry = self.entries.get(name)
+        return entry is not None and entry['inputs'] == inputs and entry['complete'] and os.path.exists(entry['output'])
+
+    def stale(self, name, inputs):
+        """Whether there is a record of rendering `name` from different
+        inputs (whose leftovers, if any, should not be resumed from)."""
+        entry = self.entries.get(name)
+        return entry is not None and entry['inputs'] != inputs
+
+    def start(self, name, inputs, output):
+        self.entries[name] = { 'inputs': inputs, 'output': output, 'complete': False }
+        self.save()
+
+    def finish(self, name, result):
+        entry = self.entries[name]
+        entry['output'] = result['output']
+        entry['complete'] = True
+        entry['stats'] = { k: result[k] for k in ('duration', 'frames', 'elapsed') }
+        self.save()
+
+    def save(self):
+        # Write atomically, so that an interrupted run never leaves behind
+        # a manifest we cannot read.
+        fd, tmp_path = tempfile.mkstemp(prefix=MANIFEST_NAME + ".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(self.path)))
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({ 'version': VERSION, 'entries': self.entries }, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except:
+            os.unlink(tmp_path)
+            raise
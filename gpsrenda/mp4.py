@@ -0,0 +1,205 @@
+"""
+Reading the metadata of MP4 / MOV files directly, rather than by running
+ffprobe.
+
+Everything we need to know about a clip before rendering it -- when it was
+recorded, how long it is, which way up the camera was, what codec it uses,
+and its size and frame rate -- is in the file's `moov` box, which is
+usually no more than a few megabytes.  probe() reads just that box, and
+parses the handful of boxes inside it that we care about:
+
+  * mvhd, for the creation time and the duration;
+  * tkhd, for the video track's rotation matrix;
+  * mdhd, for the video track's timescale;
+  * stsd, for the codec and the coded frame size; and
+  * stts, for the frame durations, and so the exact frame rate.
+
+Results are cached per file (by path, size, and modification time), so
+asking about the same clip several times only reads it once.
+"""
+
+import logging
+import math
+import os
+import struct
+from datetime import datetime, timedelta
+from fractions import Fraction
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Boxes that contain other boxes, on the way down to the ones we parse.
+CONTAINERS = { b'moov', b'trak', b'mdia', b'minf', b'stbl' }
+
+# MP4 times count from the start of 1904.
+EPOCH = datetime(1904, 1, 1)
+
+CODECS = {
+    b'avc1': 'h264',
+    b'avc3': 'h264',
+    b'hvc1': 'h265',
+    b'hev1': 'h265',
+}
+
+class VideoInfo:
+    """What probe() found out about a file.
+
+    `creation_time` is a naive datetime, exactly as it was written into the
+    file (cameras tend to write local time, despite the spec saying UTC);
+    `duration` is in seconds; `rotation` is in degrees clockwise; `codec`
+    is 'h264', 'h265', or the sample entry's four-character code if it is
+    something else; and `framerate` is a Fraction."""
+    def __init__(self, creation_time, duration, rotation, codec, width, height, framerate):
+        self.creation_time = creation_time
+        self.duration = duration
+        self.rotation = rotation
+        self.codec = codec
+        self.width = width
+        self.height = height
+        self.framerate = framerate
+
+    def __repr__(self):
+        return f"VideoInfo(creation_time={self.creation_time}, duration={self.duration:.3f}, rotation={self.rotation}, codec={self.codec}, {self.width}x{self.height}, framerate={self.framerate})"
+
+def _boxes(data, start = 0, end = None):
+    """Yields (type, payload start, payload end) for each box in
+    data[start:end]."""
+    if end is None:
+        end = len(data)
+    pos = start
+    while pos + 8 <= end:
+        (size, kind) = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            (size, ) = struct.unpack_from(">Q", data, pos + 8)
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            raise ValueError(f"malformed {kind!r} box")
+        yield (kind, pos + header, pos + size)
+        pos += size
+
+def _read_moov(f):
+    """Returns the contents of the file's top-level moov box."""
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    pos = 0
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        (size, kind) = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            (size, ) = struct.unpack(">Q", f.read(8))
+            header = 16
+        elif size == 0:
+            size = file_size - pos
+        if size < header:
+            raise ValueError(f"malformed {kind!r} box at offset {pos}")
+        if kind == b'moov':
+            f.seek(pos + header)
+            return f.read(size - header)
+        pos += size
+    raise ValueError("no moov box")
+
+def _full_box(data, start, v0, v1):
+    """Unpacks the start of a `full box' (one with a version), whose fields
+    are laid out as `v0` in version 0 and `v1` in version 1.  Returns the
+    fields and the offset just past them."""
+    version = data[start]
+    fmt = v1 if version == 1 else v0
+    return (struct.unpack_from(">" + fmt, data, start + 4), start + 4 + struct.calcsize(">" + fmt))
+
+def _parse_track(data, start, end):
+    """Returns a dict of what we know about a trak box, or None if it is
+    not a video track."""
+    track = {}
+    def walk(start, end):
+        for (kind, bstart, bend) in _boxes(data, start, end):
+            if kind in CONTAINERS:
+                walk(bstart, bend)
+            elif kind == b'tkhd':
+                (_, pos) = _full_box(data, bstart, "IIIII", "QQIIQ")
+                # reserved[2], layer, alternate_group, volume, reserved
+                pos += 16
+                matrix = struct.unpack_from(">9i", data, pos)
+                (a, b) = (matrix[0] / 65536, matrix[1] / 65536)
+                track['rotation'] = int(round(math.degrees(math.atan2(b, a)))) % 360
+            elif kind == b'mdhd':
+                ((_, _, timescale, duration), _) = _full_box(data, bstart, "IIII", "QQIQ")
+                track['timescale'] = timescale
+                track['duration'] = duration
+            elif kind == b'hdlr':
+                track['handler'] = data[bstart + 8:bstart + 12]
+            elif kind == b'stsd':
+                (entry_count, ) = struct.unpack_from(">I", data, bstart + 4)
+                if entry_count > 0:
+                    (format, _, _) = next(_boxes(data, bstart + 8, bend))
+                    track['format'] = format
+                    # The sample entry's own 8 byte header, then reserved[6],
+                    # data_reference_index, pre_defined, reserved,
+                    # pre_defined[3], and finally the width and height.
+                    (track['width'], track['height']) = struct.unpack_from(">HH", data, bstart + 8 + 8 + 24)
+            elif kind == b'stts':
+                (entry_count, ) = struct.unpack_from(">I", data, bstart + 4)
+                track['stts'] = [ struct.unpack_from(">II", data, bstart + 8 + 8 * i) for i in range(entry_count) ]
+    walk(start, end)
+    if track.get('handler') != b'vide':
+        return None
+    return track
+
+def _parse_moov(moov):
+    creation_time = None
+    movie_duration = None
+    video = None
+    for (kind, start, end) in _boxes(moov):
+        if kind == b'mvhd':
+            ((creation, _, timescale, duration), _) = _full_box(moov, start, "IIII", "QQIQ")
+            creation_time = EPOCH + timedelta(seconds = creation)
+            if timescale > 0:
+                movie_duration = duration / timescale
+        elif kind == b'trak' and video is None:
+            video = _parse_track(moov, start, end)
+
+    if video is None:
+        raise ValueError("no video track")
+    if 'format' not in video or 'timescale' not in video:
+        raise ValueError("video track has no sample description")
+
+    stts = video.get('stts', [])
+    frames = sum(count for (count, _) in stts)
+    ticks = sum(count * delta for (count, delta) in stts)
+    if frames > 0 and ticks > 0:
+        framerate = Fraction(video['timescale'] * frames, ticks)
+    else:
+        raise ValueError("video track has no samples")
+
+    if not movie_duration:
+        # Fragmented files leave the movie's duration blank.
+        movie_duration = video['duration'] / video['timescale']
+
+    return VideoInfo(
+        creation_time = creation_time,
+        duration = movie_duration,
+        rotation = video.get('rotation', 0),
+        codec = CODECS.get(video['format'], video['format'].decode('latin-1')),
+        width = video['width'],
+        height = video['height'],
+        framerate = framerate,
+    )
+
+@lru_cache(maxsize = 256)
+def _probe(path, size, mtime):
+    with open(path, "rb") as f:
+        info = _parse_moov(_read_moov(f))
+    logger.debug(f"probed {path}: {info}")
+    return info
+
+def probe(path):
+    """Returns a VideoInfo for the MP4 or MOV file at `path`.  Raises
+    ValueError if it is not one we can make sense of."""
+    st = os.stat(path)
+    try:
+        return _probe(os.path.realpath(path), st.st_size, st.st_mtime)
+    except struct.error as e:
+        raise ValueError(f"truncated box in {path}: {e}")
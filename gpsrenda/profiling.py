@@ -0,0 +1,129 @@
+"""
+Optional instrumentation for renders, to find out whether a slow render is
+spending its time decoding, drawing the overlay, or encoding.
+
+When globals['profile'] is set, the various stages of a render record how
+long they took (or, for queues, how full they were) into named histograms
+in the shared `profiler`; engines can show a summary in their progress line
+and dump the whole thing as JSON at the end of a render.  When it is not
+set, recording is a no-op, so the instrumentation can stay in place.
+"""
+
+import json
+import logging
+import os
+import random
+import time
+from array import array
+from contextlib import contextmanager
+
+import numpy as np
+
+from gpsrenda.globals import globals
+
+logger = logging.getLogger(__name__)
+
+# How many samples each histogram keeps for working out percentiles.  A
+# long render records millions of them, so past this many we keep a
+# uniform random sample of them (a reservoir) instead.
+RESERVOIR_SIZE = 4096
+
+class Histogram:
+    """The samples recorded for one stage: an exact count, mean, and
+    maximum, and a bounded reservoir of samples for the percentiles."""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = -float('inf')
+        self.samples = array('d')
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(value)
+        else:
+            i = random.randrange(self.count)
+            if i < RESERVOIR_SIZE:
+                self.samples[i] = value
+
+    def percentile(self, q):
+        # Copy, rather than taking a view: an array cannot grow while it is
+        # exported, and other threads may still be recording.
+        return float(np.percentile(np.array(self.samples), q))
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'max': self.max,
+        }
+
+class Profiler:
+    def __init__(self):
+        self.histograms = {}
+
+    @property
+    def enabled(self):
+        return globals['profile']
+
+    def record(self, name, value):
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, Histogram())
+        histogram.add(value)
+
+    @contextmanager
+    def time(self, name):
+        """Records how long the body of a `with` block takes, in
+        seconds."""
+        if not self.enabled:
+            yield
+            return
+        tst = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - tst)
+
+    def p50(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None or not histogram.samples:
+            return None
+        return histogram.percentile(50)
+
+    def reset(self):
+        self.histograms = {}
+
+    def summary(self):
+        return { name: histogram.summary() for name, histogram in sorted(self.histograms.items()) if histogram.samples }
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=1)
+        logger.info(f"wrote render profile to {path}")
+
+def combine_dumps(paths, path):
+    """Gathers the profiles that dump() wrote to each of `paths` (e.g., one
+    for each piece of a clip that was rendered in pieces) into one file at
+    `path`, as { 'pieces': [ ... ] }, in the same order, and deletes them.
+    A piece that left no profile behind (because it was rendered by an
+    earlier, interrupted run, say) is None."""
+    pieces = []
+    for piece_path in paths:
+        try:
+            with open(piece_path, "r") as f:
+                pieces.append(json.load(f))
+            os.unlink(piece_path)
+        except FileNotFoundError:
+            pieces.append(None)
+    with open(path, "w") as f:
+        json.dump({ 'pieces': pieces }, f, indent=1)
+    logger.info(f"wrote render profile for {len(paths)} pieces to {path}")
+
+profiler = Profiler()
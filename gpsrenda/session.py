@@ -0,0 +1,119 @@
+"""
+Setting up a render: loading the activity data, building the widgets that a
+config file describes, and handing them to a video engine.
+
+renda does this once, up front, for a whole run.  Clips that are rendered
+in a batch worker (see render_batch_clip()), and pieces of a clip that is
+rendered in pieces (see gpsrenda.video.segments), are rendered by new
+processes, which do it again for themselves, with clip_engine().
+"""
+
+import logging
+
+from gpsrenda.datasources import FitDataSource, PrecomputedDataSource
+from gpsrenda.globals import set_globals
+from gpsrenda.widgets.overlay import Overlay
+import gpsrenda.video
+
+logger = logging.getLogger(__name__)
+
+def load_data(config_data, data_path):
+    """Loads the activity in `data_path`, with the data settings from
+    `config_data` (a parsed config file)."""
+    return PrecomputedDataSource(FitDataSource(data_path, config=config_data.get('data', {})))
+
+def build_engine(config_data, data_source, time_offset = 0.0):
+    """Returns a video engine that draws the widgets in `config_data` (a
+    parsed config file), showing `data_source` (from load_data()), over
+    the clips that it renders, with the video `time_offset` seconds ahead
+    of the activity.  Returns (engine, set_time_offset), so that the
+    offset can be changed from one clip to the next."""
+    overlays = []
+    def build_overlay():
+        overlay = Overlay.from_config(config_data['widgets'], data_source)
+        overlays.append(overlay)
+        return overlay
+
+    overlay = build_overlay()
+
+    interactive_offset = 0.0
+    def set_time_offset(offset):
+        nonlocal time_offset
+        time_offset = offset
+
+    def adjust_time_offset(adj):
+        nonlocal interactive_offset
+        interactive_offset += adj
+        print(f"\ntime offset now set to {time_offset + interactive_offset}")
+
+    def make_frame(ctx, t):
+        overlay.render(ctx, t - time_offset - interactive_offset)
+
+    def make_tiles(t):
+        return overlay.tiles(t - time_offset - interactive_offset)
+
+    def new_tile_renderer():
+        # Widgets keep state from frame to frame, so engines that render
+        # tiles on several threads at once get a set of widgets per thread.
+        worker_overlay = build_overlay()
+        return lambda t: worker_overlay.tiles(t - time_offset - interactive_offset)
+
+    def render_stats():
+        stats = overlays[0].stats()
+        for other in list(overlays[1:]):
+            stats = [ (name, hits + other_hits, misses + other_misses) for (name, hits, misses), (_, other_hits, other_misses) in zip(stats, other.stats()) ]
+        return stats
+
+    def prepare_timeline(start_time, duration, framerate):
+        # Sample all of the clip's telemetry up front, so that the widgets
+        # just read rows out of a table while we are rendering.
+        data_source.precompute(start_time - time_offset - interactive_offset, duration, framerate)
+
+    engine = gpsrenda.video.default_engine(make_frame, adjust_time_offset = adjust_time_offset, prepare_timeline = prepare_timeline, render_stats = render_stats, render_tiles = make_tiles, new_tile_renderer = new_tile_renderer)
+    return (engine, set_time_offset)
+
+def clip_engine(config_data, data_path, time_offset):
+    """Just the engine from build_engine(), for a process that only renders
+    (part of) one clip.  Takes only picklable arguments, so that
+    functools.partial(clip_engine, ...) can be handed to another process
+    (see RenderEngineGstreamer.set_factory)."""
+    (engine, _) = build_engine(config_data, load_data(config_data, data_path), time_offset)
+    return engine
+
+# Set up in each batch worker process by init_batch_worker().
+_batch = {}
+
+def init_batch_worker(progress, log_level):
+    """Sets up a worker process for render_batch_clip(): `progress` is a
+    multiprocessing queue to report on, and `log_level` is the level for
+    gpsrenda's loggers."""
+    logging.basicConfig(format='%(asctime)s %(levelname)s [%(name)s] %(message)s', datefmt="%Y-%m-%d %H:%M:%S")
+    logging.getLogger('gpsrenda').setLevel(log_level)
+    _batch['progress'] = progress
+
+def render_batch_clip(job):
+    """Renders one clip of a batch, in a worker process set up by
+    init_batch_worker().  `job` is a dict with the clip's 'index' in the
+    batch, the engine 'factory' (see clip_engine()), the 'globals',
+    'tweaks', and 'inputs' to render with, the 'src' and 'dest', and
+    whether the render is 'overlay_only'.  Reports (index, piece, pos,
+    dur) tuples on the progress queue as it goes, and (index, None, None,
+    None) when it is done; returns the render's statistics."""
+    i = job['index']
+    progress = _batch['progress']
+    try:
+        set_globals(job['globals'])
+        engine = job['factory']()
+        engine.set_tweaks(job['tweaks'])
+        engine.set_inputs(job['inputs'])
+        engine.set_factory(job['factory'])
+        engine.set_progress(lambda pos, dur, piece = None: progress.put((i, piece, pos, dur)))
+        if job['overlay_only']:
+            return engine.render_overlay(job['src'], job['dest'])
+        else:
+            return engine.render(job['src'], job['dest'])
+    except:
+        logger.exception(f"while rendering {job['src']}:")
+        raise
+    finally:
+        progress.put((i, None, None, None))
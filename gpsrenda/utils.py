@@ -3,20 +3,36 @@ import subprocess
 
 logger = logging.getLogger(__name__)
 
+def _probe(video_path):
+    """Returns the file's gpsrenda.mp4.VideoInfo, or None if it is not an
+    MP4 file that we can parse ourselves (in which case, callers fall back
+    to asking ffprobe)."""
+    from gpsrenda.mp4 import probe
+    try:
+        return probe(video_path)
+    except ValueError as e:
+        logger.debug(f"could not parse {video_path} ({e}); falling back to ffprobe")
+        return None
+
 def extract_start_time(video_path):
     from datetime import datetime
     import pytz
     from tzlocal import get_localzone
 
-    cmd = ["ffprobe",
-           "-v", "quiet",
-           "-print_format", "compact",
-           "-show_entries", "format_tags=creation_time",
-           video_path]
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False)
-    out = process.stdout.read().decode('UTF-8', 'ignore')
-    creation_time_str = out.split("=")[1].split("Z")[0]
-    creation_time = datetime.strptime(creation_time_str, "%Y-%m-%dT%H:%M:%S.%f")
+    info = _probe(video_path)
+    if info is not None:
+        creation_time = info.creation_time
+        creation_time_str = creation_time.isoformat()
+    else:
+        cmd = ["ffprobe",
+               "-v", "quiet",
+               "-print_format", "compact",
+               "-show_entries", "format_tags=creation_time",
+               video_path]
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False)
+        out = process.stdout.read().decode('UTF-8', 'ignore')
+        creation_time_str = out.split("=")[1].split("Z")[0]
+        creation_time = datetime.strptime(creation_time_str, "%Y-%m-%dT%H:%M:%S.%f")
     local_tz = get_localzone()
     try:
       localized_creation_time = local_tz.localize(creation_time)
@@ -29,9 +45,9 @@ def extract_start_time(video_path):
     return utc_creation_time
 
 def extract_duration(video_path):
-    from datetime import datetime
-    import pytz
-    from tzlocal import get_localzone
+    info = _probe(video_path)
+    if info is not None:
+        return info.duration
 
     cmd = ["ffprobe",
            "-v", "quiet",
@@ -43,7 +59,58 @@ def extract_duration(video_path):
     duration_str = out.split("=")[1].split("Z")[0]
     return float(duration_str)
 
+def extract_dimensions(video_path):
+    info = _probe(video_path)
+    if info is not None:
+        return (info.width, info.height)
+
+    cmd = ["ffprobe",
+           "-v", "quiet",
+           "-of", "csv=p=0",
+           "-select_streams", "v:0",
+           "-show_entries", "stream=width,height",
+           video_path]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False)
+    out = process.stdout.read().decode('UTF-8', 'ignore')
+    (width, height) = out.strip().split(",")[0:2]
+    return (int(width), int(height))
+
+def extract_keyframes(video_path):
+    """Returns the presentation times, in seconds, of the keyframes in a
+    video's first video stream.  This only reads packet headers, so it
+    does not need to decode anything."""
+    cmd = ["ffprobe",
+           "-v", "quiet",
+           "-of", "csv=p=0",
+           "-select_streams", "v:0",
+           "-show_entries", "packet=pts_time,flags",
+           video_path]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False)
+    out = process.stdout.read().decode('UTF-8', 'ignore')
+    keyframes = []
+    for line in out.splitlines():
+        fields = line.split(",")
+        if len(fields) >= 2 and fields[1].startswith("K") and fields[0] not in ("", "N/A"):
+            keyframes.append(float(fields[0]))
+    return sorted(keyframes)
+
+def extract_codec(video_path):
+    """Returns 'h264' or 'h265' (or some other codec name) for a video's
+    first video stream, or None if we cannot tell."""
+    info = _probe(video_path)
+    return info.codec if info is not None else None
+
+def extract_framerate(video_path):
+    """Returns the average frame rate of a video's first video stream, as a
+    Fraction, or None if we cannot tell."""
+    info = _probe(video_path)
+    return info.framerate if info is not None else None
+
 def is_flipped(video_path):
+    info = _probe(video_path)
+    if info is not None:
+        return info.rotation == 180
+
     cmd = ["ffprobe",
            "-v", "quiet",
            "-of", "default=nw=1:nk=1",
@@ -64,6 +131,16 @@ def seconds_to_timestamp(seconds):
     from pytz import utc
     return utc.localize(datetime.min + timedelta(seconds=seconds))
 
+def snap_to_frame(pos, framerate):
+    """Returns the index of the frame that `pos` seconds into a video is
+    shown in, at `framerate`, and the time of that frame's slot -- which is
+    exactly a row of a timeline sampled at the same frame rate.  Without a
+    frame rate, returns (None, pos)."""
+    if not framerate:
+        return (None, pos)
+    k = int(round(pos * framerate))
+    return (k, k / framerate)
+
 def km_to_mi(km):
     return km / 1.609
 
@@ -0,0 +1,153 @@
+"""
+Tuning the GStreamer pipeline's knobs for the machine that we are running
+on.
+
+The right number of decoder and encoder threads, how much video to buffer,
+and so on, depend on how many cores a machine has and on what else is
+slow on it, so rather than guessing, autotune() renders the first few
+seconds of a clip over and over with different settings, keeps whichever
+were fastest, and saves them in a per-machine profile.  apply_profile()
+loads that profile into globals['video']['gstreamer'] on later runs.
+"""
+
+import json
+import logging
+import os
+import shutil
+import socket
+import statistics
+import tempfile
+import time
+
+from gpsrenda.globals import globals
+
+logger = logging.getLogger(__name__)
+
+# The settings that we try, one at a time, in this order, and the values
+# that we try for each of them.
+def _parameters():
+    cpus = os.cpu_count() or 4
+    return [
+        ('decode_threads',  sorted(set([ 2, 4, 6, 8, cpus ]))),
+        ('encode_threads',  sorted(set([ 2, 4, 8, cpus ]))),
+        ('overlay_threads', [ 0, 2, 4 ]),
+        ('queue_size_mb',   [ 25, 100, 400 ]),
+    ]
+
+# x264's presets, from slowest (best-looking) to fastest.
+SPEED_PRESETS = [ 'slow', 'medium', 'fast', 'faster', 'veryfast', 'superfast', 'ultrafast' ]
+
+# A different setting has to be at least this much faster to be worth
+# switching to, so that we are not just chasing noise.
+MIN_IMPROVEMENT = 1.03
+
+# How many times to render each candidate; we go by the median of them.
+TRIALS = 2
+
+def profile_path():
+    """Where this machine's profile lives."""
+    config_dir = os.path.join(os.environ.get('XDG_CONFIG_HOME', os.path.expanduser('~/.config')), 'gpsrenda')
+    return os.path.join(config_dir, f"machine-{socket.gethostname()}.json")
+
+def load_profile():
+    """Returns the tuned settings for this machine, or {} if it has not
+    been tuned."""
+    try:
+        with open(profile_path(), "r") as f:
+            return json.load(f)['settings']
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"machine profile {profile_path()} is unreadable ({e}); ignoring it")
+        return {}
+
+def apply_profile():
+    """Loads this machine's tuned settings into
+    globals['video']['gstreamer'].  Call this before applying a config
+    file's globals, so that anything set explicitly there still wins."""
+    settings = load_profile()
+    if settings:
+        logger.debug(f"using tuned settings from {profile_path()}: {settings}")
+        globals['video']['gstreamer'].update(settings)
+
+def save_profile(settings, fps):
+    path = profile_path()
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    # Write atomically, so that a tuning run that dies part way through
+    # never leaves behind a profile we cannot read.
+    fd, tmp_path = tempfile.mkstemp(prefix = os.path.basename(path) + ".", suffix = ".tmp", dir = os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump({
+                'hostname': socket.gethostname(),
+                'cpus': os.cpu_count(),
+                'tuned_at': time.strftime("%Y-%m-%dT%H:%M:%S"),
+                'fps': fps,
+                'settings': settings,
+            }, f, indent = 1)
+        os.replace(tmp_path, path)
+    except:
+        os.unlink(tmp_path)
+        raise
+    logger.info(f"wrote tuned settings to {path}")
+
+def autotune(engine, src, seconds = 10, speed_presets = None, target_realtime = 1.0):
+    """Finds the fastest settings for rendering `src` with `engine`, by
+    trial renders of its first `seconds` (TRIALS of them for each
+    candidate), tuning one setting at a time.
+
+    Faster x264 presets are always faster, so those are only tried if
+    `speed_presets` are given, and then the slowest (i.e., best-looking)
+    one that still renders at least `target_realtime` times faster than
+    realtime wins.  Saves the result as this machine's profile, and
+    returns (settings, frames per second)."""
+    gstglobals = globals['video']['gstreamer']
+    parameters = _parameters()
+    original = dict(gstglobals)
+    settings = { name: gstglobals[name] for name, _ in parameters }
+
+    tmpdir = tempfile.mkdtemp(prefix = "gpsrenda-autotune-")
+    trial_path = os.path.join(tmpdir, "trial.mp4")
+    def trial(candidate):
+        gstglobals.update(candidate)
+        runs = []
+        for _ in range(TRIALS):
+            result = engine.render_trial(src, trial_path, seconds)
+            runs.append(result['elapsed'])
+        elapsed = statistics.median(runs)
+        fps = result['frames'] / elapsed
+        realtime = result['duration'] / elapsed
+        print(f"{', '.join(f'{k}={v}' for k, v in candidate.items())}: {fps:.1f} fps ({realtime:.2f}x realtime)")
+        return (fps, realtime)
+
+    try:
+        # Trial renders do not need to be resumable.
+        gstglobals['checkpoint_interval'] = 0
+
+        (best_fps, _) = trial(settings)
+        for name, values in parameters:
+            for value in values:
+                if value == settings[name]:
+                    continue
+                candidate = dict(settings, **{ name: value })
+                (fps, _) = trial(candidate)
+                if fps > best_fps * MIN_IMPROVEMENT:
+                    (settings, best_fps) = (candidate, fps)
+
+        if speed_presets:
+            # Slowest (best quality) first.
+            for preset in speed_presets:
+                candidate = dict(settings, speed_preset = preset)
+                (fps, realtime) = trial(candidate)
+                if realtime >= target_realtime:
+                    (settings, best_fps) = (candidate, fps)
+                    break
+            else:
+                logger.warning(f"none of the speed presets reached {target_realtime:.1f}x realtime; leaving speed_preset alone")
+    finally:
+        gstglobals.clear()
+        gstglobals.update(original)
+        shutil.rmtree(tmpdir, ignore_errors = True)
+
+    save_profile(settings, best_fps)
+    return (settings, best_fps)
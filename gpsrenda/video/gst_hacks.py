@@ -11,6 +11,8 @@ import gi
 gi.require_version('Gst', '1.0')
 from gi.repository import Gst, GObject
 
+from gpsrenda.profiling import profiler
+
 # CONST from gstconfig.h
 # https://github.com/Kurento/gstreamer/blob/0d6031b200e189b391d9c0882760109c1d8cf837/win32/common/gstconfig.h#L67
 _GST_PADDING = 4  # From gstconfig.h
@@ -27,6 +29,14 @@ class _GstMapInfo(Structure):
 
 _GST_MAP_INFO_POINTER = POINTER(_GstMapInfo)
 
+
+class _GstMiniObject(Structure):
+    # Only the start of it: enough to get at the reference count.
+    _fields_ = [("type", c_size_t),  # GType type
+                ("refcount", c_int),  # gint refcount
+                ("lockstate", c_int),  # gint lockstate
+                ("flags", c_uint)]  # guint flags
+
 if platform.system() == 'Windows':
     _libgst = CDLL("libgstreamer-1.0-0.dll")
 elif platform.system() == 'Darwin':
@@ -45,6 +55,12 @@ _libgst.gst_buffer_unmap.restype = None
 _libgst.gst_mini_object_is_writable.argtypes = [c_void_p]
 _libgst.gst_mini_object_is_writable.restype = c_int
 
+_libgst.gst_buffer_n_memory.argtypes = [c_void_p]
+_libgst.gst_buffer_n_memory.restype = c_uint
+
+_libgst.gst_buffer_peek_memory.argtypes = [c_void_p, c_uint]
+_libgst.gst_buffer_peek_memory.restype = c_void_p
+
 
 @contextmanager
 def map_gst_buffer(pbuffer, flags):
@@ -65,15 +81,86 @@ def map_gst_buffer(pbuffer, flags):
         raise ValueError("Writable array requested but buffer is not writeable")
 
     mapping = _GstMapInfo()
-    success = _libgst.gst_buffer_map(ptr, mapping, flags)
+    with profiler.time("gst/map"):
+        success = _libgst.gst_buffer_map(ptr, mapping, flags)
     if not success:
         raise RuntimeError("Couldn't map buffer")
     try:
         yield cast(
             mapping.data, POINTER(c_byte * mapping.size)).contents
     finally:
-        _libgst.gst_buffer_unmap(ptr, mapping)
-        
+        with profiler.time("gst/unmap"):
+            _libgst.gst_buffer_unmap(ptr, mapping)
+
+
+@contextmanager
+def writable_mini_object(pobject):
+    """
+        Let GStreamer treat a Gst.MiniObject (a buffer, an overlay
+        composition, ...) as writable, for the duration of a `with` block
+
+        PyGObject holds a reference of its own to any mini object that it
+        hands to Python, so GStreamer never believes that it is writable,
+        and refuses to change it.  When that is the only other reference,
+        we hide it inside the block.  Nothing else can see the object, so
+        nothing else can be changing its reference count under us.
+
+        :param pobject: https://lazka.github.io/pgi-docs/Gst-1.0/classes/MiniObject.html
+    """
+    if pobject is None:
+        raise TypeError("Cannot pass NULL to writable_mini_object")
+
+    mini_object = _GstMiniObject.from_address(hash(pobject))
+    # Ours, and PyGObject's.
+    hidden = mini_object.refcount - 1
+    if hidden > 1:
+        raise ValueError("Writable object requested but it is shared")
+
+    mini_object.refcount -= hidden
+    try:
+        yield
+    finally:
+        mini_object.refcount += hidden
+
+
+@contextmanager
+def map_gst_buffer_writable(pbuffer):
+    """
+        Map Gst.Buffer for writing, in place wherever possible
+
+        GStreamer maps the buffer's memory in place if nobody else is using
+        it, and only copies it into the buffer first if it is shared (say,
+        with the other side of a tee) or read-only.  See
+        writable_mini_object() for how we get it to map it at all.
+
+        Yields (data, copied), where `copied` says whether GStreamer had to
+        copy the memory to make it writable.
+
+        :param pbuffer: https://lazka.github.io/pgi-docs/Gst-1.0/classes/Buffer.html
+        :type pbuffer: Gst.Buffer
+    """
+    if pbuffer is None:
+        raise TypeError("Cannot pass NULL to map_gst_buffer_writable")
+
+    ptr = hash(pbuffer)
+    nmemory = _libgst.gst_buffer_n_memory(ptr)
+    memory = _libgst.gst_buffer_peek_memory(ptr, 0) if nmemory == 1 else None
+
+    mapping = _GstMapInfo()
+    with profiler.time("gst/map"):
+        with writable_mini_object(pbuffer):
+            success = _libgst.gst_buffer_map(ptr, mapping, Gst.MapFlags.READ | Gst.MapFlags.WRITE)
+    if not success:
+        raise RuntimeError("Couldn't map buffer")
+    # GStreamer either merged several memories into one, or swapped in a
+    # copy of one that it could not write to.
+    copied = memory is None or mapping.memory != memory
+    try:
+        yield (cast(mapping.data, POINTER(c_byte * mapping.size)).contents, copied)
+    finally:
+        with profiler.time("gst/unmap"):
+            _libgst.gst_buffer_unmap(ptr, mapping)
+
 
 def get_buffer_size(caps):
     """
@@ -2,10 +2,20 @@ import sys
 import logging
 import time
 import datetime
+import json
+import os
 import re
 import signal
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ctypes import addressof
+from fractions import Fraction
+from functools import partial
+from glob import glob
 
 import cairo
+import numpy as np
 import gi
 gi.require_version('Gst', '1.0')
 gi.require_version('GstApp', '1.0')
@@ -14,11 +24,14 @@ gi.require_version('GstVideo', '1.0')
 from gi.repository import Gst, GstApp, GstBase, GstVideo, GLib, GObject
 
 from gpsrenda.globals import globals
-from gpsrenda.utils import extract_start_time, timestamp_to_seconds, seconds_to_timestamp, is_flipped, merge_dict
+from gpsrenda.profiling import combine_dumps, profiler
+from gpsrenda.utils import extract_start_time, extract_duration, extract_dimensions, extract_keyframes, extract_codec, extract_framerate, timestamp_to_seconds, seconds_to_timestamp, is_flipped, merge_dict, snap_to_frame
 
 from .engines import register_engine
 
-from .gst_hacks import map_gst_buffer
+from .gst_hacks import map_gst_buffer_writable, writable_mini_object
+from .segments import PieceProcess, split_points
+from .sparse import render_sparse_overlay
 
 Gst.init(sys.argv)
 #Gst.init_python()
@@ -33,9 +46,9 @@ class VideoSourceGoPro:
             self.flip = is_flipped(filename)
         else:
             self.flip = tweaks['force_rotation'] == 180
-        self.h265 = globals['video']['gstreamer']['h265'] # needed until we can pull this out of the file with libav
+        self.h265 = globals['video']['gstreamer']['h265'] # only used if we cannot read the codec out of the file
         self.pcm = globals['video']['gstreamer']['pcm_audio']
-        self.framerate = globals['video']['gstreamer']['framerate'] # needed until we can pull this out of the file with libav
+        self.framerate = globals['video']['gstreamer']['framerate'] # only used if we cannot read the frame rate out of the file
         self.start_time_from_chinese_dashcam_filename = False
         if tweaks['scale'] is None:
             self.scale = None
@@ -44,6 +57,11 @@ class VideoSourceGoPro:
             if m is None:
                 raise ValueError('scale parameter in globals/tweaks is not WxH')
             self.scale = (int(m[1]), int(m[2]))
+        if tweaks['scale_factor'] != 1.0:
+            (w, h) = self.scale or extract_dimensions(filename)
+            # Encoders want even sizes.
+            self.scale = (int(round(w * tweaks['scale_factor'] / 2)) * 2, int(round(h * tweaks['scale_factor'] / 2)) * 2)
+            logger.debug(f"scaling {filename} to {self.scale[0]}x{self.scale[1]}")
         self.splitmux = False
         if re.match(r'.*G[HXL]01....\.(MP4|LRV)', self.filename):
             self.splitmux = True
@@ -62,6 +80,18 @@ class VideoSourceGoPro:
             self.h265 = False
             self.start_time_from_chinese_dashcam_filename = True
 
+        # The guesses above are from the filename; if the file itself can
+        # tell us, believe it instead.
+        codec = extract_codec(self.filename)
+        if codec in ('h264', 'h265'):
+            self.h265 = codec == 'h265'
+        elif codec is not None:
+            logger.warning(f"{filename} is {codec}, which we do not know how to decode; trying {'h265' if self.h265 else 'h264'}")
+        framerate = extract_framerate(self.filename)
+        if framerate is not None:
+            self.framerate = float(framerate)
+        logger.debug(f"{filename}: {'h265' if self.h265 else 'h264'}, {self.framerate:.3f} fps")
+
         self.decoder = globals['video']['gstreamer']['decoder']
         if self.decoder is None:
             # D3D11 is actually slower by default, so we do not use it!
@@ -84,8 +114,12 @@ class VideoSourceGoPro:
                 logger.debug(f"no hardware accelerated decoder found; using software decoder")
                 self.decoder = 'software'
     
-    def add_to_pipeline(self, pipeline):
-        """Returns a tuple of GstElements that have src pads for *decoded* video and *encoded* audio."""
+    def add_to_pipeline(self, pipeline, gl_memory = False):
+        """Returns a tuple of GstElements that have src pads for *decoded* video and *encoded* audio.
+
+        If `gl_memory` is set, and the decoder can, the video is left in GL
+        memory (and self.gl_output says whether it was)."""
+        self.gl_output = False
         def mkelt(eltype):
             elt = Gst.ElementFactory.make(eltype, None)
             assert elt
@@ -152,10 +186,16 @@ class VideoSourceGoPro:
             
             csc1 = mkelt("glcolorconvert")
             scaleout.link(csc1)
-            
-            vout = mkelt("gldownload")
-            csc1.link(vout)
-            
+
+            # Only the tweaks that we have to do in software need the
+            # frames in system memory.
+            if gl_memory and not any(tweak in self.tweaks for tweak in ('brightness', 'contrast', 'gamma')):
+                vout = csc1
+                self.gl_output = True
+            else:
+                vout = mkelt("gldownload")
+                csc1.link(vout)
+
             if 'brightness' in self.tweaks or 'contrast' in self.tweaks:
                 videobalance = mkelt("videobalance")
                 if 'brightness' in self.tweaks:
@@ -218,7 +258,7 @@ class VideoSourceGoPro:
             if self.decoder == 'software':
                 avdec = mkelt("avdec_h265" if self.h265 else "avdec_h264")
                 multiqueue.get_static_pad(f"src_{multiqueue_vpad.get_name().split('_')[1]}").link(avdec.get_static_pad("sink"))
-                avdec.set_property("max-threads", 6)
+                avdec.set_property("max-threads", globals['video']['gstreamer']['decode_threads'])
             else:
                 avdec = mkelt("vtdec_hw")
                 multiqueue.get_static_pad(f"src_{multiqueue_vpad.get_name().split('_')[1]}").link(avdec.get_static_pad("sink"))
@@ -259,9 +299,14 @@ class VideoSourceGoPro:
             vout.link(voutg)
             vout = voutg
 
-        queuev1 = mkelt("queue")
-        queuev1.set_property("max-size-bytes", 100 * 1024 * 1024)
-        avdec.link(queuev1)
+        # Decouple decoding from the overlay (and everything after it).
+        # This used to hang off of the decoder, unlinked, so it did
+        # nothing; it is named so that profiling can find it.
+        queuev1 = Gst.ElementFactory.make("queue", "decode_queue")
+        pipeline.add(queuev1)
+        queuev1.set_property("max-size-bytes", globals['video']['gstreamer']['queue_size_mb'] * 1024 * 1024)
+        assert(vout.link(queuev1))
+        vout = queuev1
         
         return (aout, vout)
 
@@ -306,8 +351,93 @@ class VideoSourceGoPro:
         else:
             return timestamp_to_seconds(extract_start_time(self.filename))
 
+    def duration(self):
+        if self.splitmux:
+            return sum(extract_duration(chapter) for chapter in glob(self.splitfilename))
+        else:
+            return extract_duration(self.filename)
+
+    def keyframes(self):
+        """Returns the times of the keyframes in the video, in seconds
+        from the start of the (possibly glued-together) video."""
+        if self.splitmux:
+            # splitmuxsrc plays the chapters back in order, one after
+            # another.
+            keyframes = []
+            offset = 0
+            for chapter in sorted(glob(self.splitfilename)):
+                keyframes += [ offset + t for t in extract_keyframes(chapter) ]
+                offset += extract_duration(chapter)
+            return keyframes
+        else:
+            return extract_keyframes(self.filename)
+
+    def dimensions(self):
+        """Returns the (width, height) of the frames that add_to_pipeline
+        would produce."""
+        if self.scale:
+            return self.scale
+        return extract_dimensions(self.filename)
+
+class OverlayPrerenderer:
+    """
+    Renders the overlay's tiles for upcoming frames on a pool of worker
+    threads, so that the streaming thread only has to composite them.
+    pycairo drops the GIL while cairo is drawing, so the workers really do
+    run in parallel with each other (and with the encoder).
+
+    Frame k of a clip is at `video_start_time + k / framerate`; whenever
+    the overlay element asks for frame k, we make sure that the next
+    `lookahead` frames are queued up, too.
+    """
+    def __init__(self, new_tile_renderer, threads, lookahead = None):
+        self.new_tile_renderer = new_tile_renderer
+        self.local = threading.local()
+        self.pool = ThreadPoolExecutor(max_workers = threads, thread_name_prefix = "overlay")
+        self.lookahead = lookahead if lookahead is not None else threads * 2
+        self.pending = {}
+
+    def _render(self, t):
+        # Each worker thread gets its own widgets.
+        if not hasattr(self.local, 'render_tiles'):
+            self.local.render_tiles = self.new_tile_renderer()
+        return [ tile.snapshot() for tile in self.local.render_tiles(t) ]
+
+    def tiles(self, video_start_time, framerate, k):
+        """Returns the snapshots of the overlay's tiles for frame k."""
+        # Forget about anything we will not get to (e.g., after a seek).
+        for i in [ i for i in self.pending if i < k or i >= k + self.lookahead ]:
+            self.pending.pop(i).cancel()
+
+        for i in range(k, k + self.lookahead):
+            if i not in self.pending:
+                self.pending[i] = self.pool.submit(self._render, video_start_time + i / framerate)
+
+        return self.pending[k].result()
+
+    def shutdown(self):
+        self.pool.shutdown(wait = True, cancel_futures = True)
+        self.pending = {}
+
+def unpremultiply(data, w, h):
+    """Cairo draws with premultiplied alpha, but everything downstream of
+    us expects straight alpha.  Only pixels that are partly transparent
+    need fixing; fully transparent and fully opaque ones are already
+    right."""
+    pixels = np.frombuffer(data, dtype = np.uint8).reshape(h, w, 4)
+    alpha = pixels[:, :, 3]
+    partial = (alpha != 0) & (alpha != 255)
+    if not partial.any():
+        return
+    a = alpha[partial].astype(np.uint16)[:, None]
+    pixels[partial, 0:3] = np.minimum((pixels[partial, 0:3].astype(np.uint16) * 255 + a // 2) // a, 255).astype(np.uint8)
+
 TRANSFORM_VERBOSE = False
 
+# Buffers come out of a pool, so the same few blocks of memory come round
+# again and again; we keep this many cairo surfaces around for them.
+SURFACE_CACHE_SIZE = 32
+
 # https://github.com/jackersson/gst-overlay/blob/master/gst_overlay/gst_overlay_cairo.py
 class GstOverlayGPS(GstBase.BaseTransform):
     __gstmetadata__ = ("GPS overlay object",
@@ -323,29 +453,94 @@ class GstOverlayGPS(GstBase.BaseTransform):
                                             Gst.PadPresence.ALWAYS,
                                             Gst.Caps.from_string("video/x-raw,format=BGRA,width=[1,2147483647],height=[1,2147483647]")))
 
-    def __init__(self, painter, video_start_time):
+    def __init__(self, painter, video_start_time, prerenderer = None, framerate = None, straight_alpha = False):
         print(self.__gsttemplates__)
         super(GstOverlayGPS, self).__init__()
         self.painter = painter
         self.video_start_time = video_start_time
+        self.prerenderer = prerenderer
+        self.framerate = framerate
+        self.straight_alpha = straight_alpha
+        self.width = None
+        self.height = None
+        self.caps_framerate = None
         self.last_tm = time.time()
         self.frames_processed = 0
         self.time_in_cairo = 0
         self.last_pos = 0
+        self.frame = None
+        self.surfaces = {}
+        self.buffer_copies = 0
+
+    def do_set_caps(self, incaps, outcaps):
+        structure = outcaps.get_structure(0)
+        self.width = structure.get_value("width")
+        self.height = structure.get_value("height")
+        # Variable frame rate streams (from phones, say) negotiate 0/1; then
+        # the best we can do is the clip's average, which we were given.
+        (ok, num, den) = structure.get_fraction("framerate")
+        self.caps_framerate = Fraction(num, den) if ok and num > 0 and den > 0 else None
+        return True
+
+    def _surface(self, data, w, h):
+        """Returns a cairo surface that draws into the mapped buffer
+        `data`, reusing the one we made last time that this block of memory
+        came round."""
+        key = (addressof(data), len(data), w, h)
+        surf = self.surfaces.get(key)
+        if surf is None:
+            if len(self.surfaces) >= SURFACE_CACHE_SIZE:
+                self.surfaces.clear()
+            surf = cairo.ImageSurface.create_for_data(data, cairo.FORMAT_ARGB32, w, h)
+            self.surfaces[key] = surf
+        else:
+            # There is a new frame in there since cairo last looked.
+            surf.mark_dirty()
+        return surf
+
+    def _frame_time(self, buffer):
+        """Returns the index of this buffer's frame, and the time (relative
+        to the start of the video) that the overlay should show for it.
+
+        The frame comes from the buffer's own timestamp, converted to
+        stream time, so that it cannot drift away from the video; and the
+        time is snapped to the frame's slot at the negotiated frame rate,
+        so that it lands exactly on a row of the precomputed timeline.
+        Without a frame rate, the time is just the buffer's own."""
+        pts = buffer.pts
+        if pts == Gst.CLOCK_TIME_NONE:
+            # Fall back to wherever the segment has got to.
+            stream_time = self.segment.position
+        else:
+            stream_time = self.segment.to_stream_time(Gst.Format.TIME, pts)
+            if stream_time == Gst.CLOCK_TIME_NONE:
+                stream_time = pts
+        return snap_to_frame(stream_time / Gst.SECOND, self.caps_framerate or self.framerate)
 
     def do_transform_ip(self, buffer):
         tst = time.time()
-        caps = self.srcpad.get_current_caps()
-        h = caps.get_structure(0).get_value("height")
-        w = caps.get_structure(0).get_value("width")
+        (w, h) = (self.width, self.height)
+        (self.frame, pos) = self._frame_time(buffer)
 
-        with map_gst_buffer(buffer, Gst.MapFlags.READ) as data:
-            surf = cairo.ImageSurface.create_for_data(data, cairo.FORMAT_ARGB32, w, h)
+        with map_gst_buffer_writable(buffer) as (data, copied):
+            if copied:
+                self.buffer_copies += 1
+            surf = self._surface(data, w, h)
             ctx = cairo.Context(surf)
-            self.painter(ctx, self.video_start_time + self.segment.position / 1000000000)
+            ost = time.perf_counter()
+            if self.prerenderer and self.frame is not None:
+                for (tile, x, y, alpha) in self.prerenderer.tiles(self.video_start_time, self.caps_framerate or self.framerate, self.frame):
+                    ctx.set_source_surface(tile, x, y)
+                    ctx.paint_with_alpha(alpha)
+            else:
+                self.painter(ctx, self.video_start_time + pos)
+            profiler.record("overlay/frame", time.perf_counter() - ost)
+            if self.straight_alpha:
+                surf.flush()
+                unpremultiply(data, w, h)
 
         self.frames_processed += 1
-        self.last_pos = self.segment.position / 1000000000
+        self.last_pos = pos
         if TRANSFORM_VERBOSE or (self.frames_processed % 100) == 0:
             print(f"transform took {(time.time() - tst) * 1000:.1f}ms, {1 / (time.time() - self.last_tm):.1f} fps")
         self.time_in_cairo += time.time() - tst
@@ -353,27 +548,611 @@ class GstOverlayGPS(GstBase.BaseTransform):
 
         return Gst.FlowReturn.OK
 
+class GstOverlayCompositionGPS(GstOverlayGPS):
+    """
+    Rather than drawing the overlay into each frame, attaches it to the
+    frame as a GstVideoOverlayCompositionMeta, with one rectangle per tile,
+    for something downstream (gloverlaycompositor) to blend in wherever is
+    cheapest.  We never touch the frame's pixels, so it can be in whatever
+    format (or memory) the decoder gave us; and a tile that has not changed
+    keeps the same rectangle from frame to frame, so that the compositor
+    only has to upload the ones that have.
+    """
+    __gstmetadata__ = ("GPS overlay composition object",
+                       "video.py",
+                       "GPS overlay, as overlay composition metadata",
+                       "jwise")
+    __gsttemplates__ = (Gst.PadTemplate.new("src",
+                                            Gst.PadDirection.SRC,
+                                            Gst.PadPresence.ALWAYS,
+                                            Gst.Caps.from_string("video/x-raw(ANY)")),
+                        Gst.PadTemplate.new("sink",
+                                            Gst.PadDirection.SINK,
+                                            Gst.PadPresence.ALWAYS,
+                                            Gst.Caps.from_string("video/x-raw(ANY)")))
+
+    def __init__(self, render_tiles, video_start_time, prerenderer = None, framerate = None):
+        super(GstOverlayCompositionGPS, self).__init__(None, video_start_time, prerenderer = prerenderer, framerate = framerate)
+        self.render_tiles = render_tiles
+        self.rectangles = []
+        self.composition = None
+        self.redraws = 0
+
+    def _rectangle(self, surface, x, y, alpha):
+        surface.flush()
+        (w, h) = (surface.get_width(), surface.get_height())
+        pixels = Gst.Buffer.new_wrapped(bytes(surface.get_data()))
+        with writable_mini_object(pixels):
+            # cairo's ARGB32 is BGRA in memory, on the little-endian
+            # machines we run on, and premultiplied.
+            GstVideo.buffer_add_video_meta(pixels, GstVideo.VideoFrameFlags.NONE, GstVideo.VideoFormat.BGRA, w, h)
+        rectangle = GstVideo.VideoOverlayRectangle.new_raw(pixels, x, y, w, h, GstVideo.VideoOverlayFormatFlags.PREMULTIPLIED_ALPHA)
+        if alpha != 1.0:
+            rectangle.set_global_alpha(alpha)
+        return rectangle
+
+    def _composition(self, snapshots):
+        """Returns the composition for a frame's tiles, reusing the last
+        frame's if none of them have changed."""
+        changed = len(snapshots) != len(self.rectangles)
+        if changed:
+            self.rectangles = [ (None, None) ] * len(snapshots)
+        for i, snapshot in enumerate(snapshots):
+            (last, _) = self.rectangles[i]
+            # A tile draws into a new surface whenever it changes (and we
+            # hold on to the last one, so its id cannot be reused).
+            if last is None or snapshot[0] is not last[0] or snapshot[1:] != last[1:]:
+                self.rectangles[i] = (snapshot, self._rectangle(*snapshot))
+                changed = True
+        if not snapshots:
+            return None
+        if changed or self.composition is None:
+            rectangles = [ rectangle for (_, rectangle) in self.rectangles ]
+            self.composition = GstVideo.VideoOverlayComposition.new(rectangles[0])
+            with writable_mini_object(self.composition):
+                for rectangle in rectangles[1:]:
+                    self.composition.add_rectangle(rectangle)
+            self.redraws += 1
+        return self.composition
+
+    def do_transform_ip(self, buffer):
+        tst = time.time()
+        (self.frame, pos) = self._frame_time(buffer)
+
+        ost = time.perf_counter()
+        if self.prerenderer and self.frame is not None:
+            snapshots = self.prerenderer.tiles(self.video_start_time, self.caps_framerate or self.framerate, self.frame)
+        else:
+            snapshots = [ tile.snapshot() for tile in self.render_tiles(self.video_start_time + pos) ]
+        composition = self._composition(snapshots)
+        if composition is not None:
+            with writable_mini_object(buffer):
+                GstVideo.buffer_add_video_overlay_composition_meta(buffer, composition)
+        profiler.record("overlay/frame", time.perf_counter() - ost)
+
+        self.frames_processed += 1
+        self.last_pos = pos
+        self.time_in_cairo += time.time() - tst
+
+        return Gst.FlowReturn.OK
+
+class OverlayTexture:
+    """
+    The overlay as a stream of its own, for compositing onto the video on
+    the GPU with glvideomixer, rather than drawing it into every decoded
+    frame: then frames that were decoded into GL memory can stay there, and
+    the only thing that has to be uploaded is the overlay.  Each frame only
+    covers the rectangle that the tiles are in, and a frame whose tiles have
+    not changed since the last one reuses its buffer.
+
+    The frames come from an appsrc, which asks us for frame k whenever the
+    mixer needs it, and tells us where to carry on from after a seek.  Like
+    GstOverlayGPS, this counts frames_processed (and so on), for the
+    progress display.
+    """
+    def __init__(self, render_tiles, video_start_time, framerate, stop, prerenderer = None):
+        self.render_tiles = render_tiles
+        self.video_start_time = video_start_time
+        self.framerate = Fraction(framerate).limit_denominator(1001)
+        self.end = int(round(stop * self.framerate))
+        self.prerenderer = prerenderer
+        self.k = 0
+        self.last_snapshots = None
+        self.last_buffer = None
+        self.frames_processed = 0
+        self.redraws = 0
+        self.time_in_cairo = 0
+        self.buffer_copies = 0
+        self.last_pos = 0
+
+        # The tiles stay put, so the rectangle that they cover does, too.
+        tiles = render_tiles(video_start_time)
+        if tiles:
+            x0 = min(tile.x for tile in tiles)
+            y0 = min(tile.y for tile in tiles)
+            x1 = max(tile.x + tile.width for tile in tiles)
+            y1 = max(tile.y + tile.height for tile in tiles)
+            self.bounds = (x0, y0, x1 - x0, y1 - y0)
+        else:
+            self.bounds = (0, 0, 1, 1)
+
+    def add_to_pipeline(self, pipeline):
+        """Adds an appsrc for the overlay to `pipeline`, and returns it."""
+        (_, _, w, h) = self.bounds
+        appsrc = Gst.ElementFactory.make("appsrc", "overlay_src")
+        appsrc.set_property("caps", Gst.Caps.from_string(f"video/x-raw,format=BGRA,width={w},height={h},framerate={self.framerate.numerator}/{self.framerate.denominator}"))
+        appsrc.set_property("format", Gst.Format.TIME)
+        appsrc.set_property("stream-type", GstApp.AppStreamType.SEEKABLE)
+        appsrc.set_property("max-buffers", 4)
+        appsrc.connect("need-data", self._need_data)
+        appsrc.connect("seek-data", self._seek_data)
+        pipeline.add(appsrc)
+        return appsrc
+
+    def _seek_data(self, appsrc, offset):
+        self.k = int(round(offset / Gst.SECOND * self.framerate))
+        return True
+
+    def _compose(self, snapshots):
+        (x0, y0, w, h) = self.bounds
+        surf = cairo.ImageSurface(cairo.FORMAT_ARGB32, w, h)
+        ctx = cairo.Context(surf)
+        for (surface, x, y, alpha) in snapshots:
+            ctx.set_source_surface(surface, x - x0, y - y0)
+            ctx.paint_with_alpha(alpha)
+        surf.flush()
+        data = surf.get_data()
+        unpremultiply(data, w, h)
+        return Gst.Buffer.new_wrapped(bytes(data))
+
+    def _need_data(self, appsrc, length):
+        if self.k >= self.end:
+            appsrc.emit("end-of-stream")
+            return
+        tst = time.time()
+        ost = time.perf_counter()
+        if self.prerenderer:
+            snapshots = self.prerenderer.tiles(self.video_start_time, self.framerate, self.k)
+        else:
+            snapshots = [ tile.snapshot() for tile in self.render_tiles(self.video_start_time + self.k / self.framerate) ]
+
+        # A tile draws into a new surface whenever it changes (and we hold
+        # on to the last ones, so their ids cannot be reused).
+        if self.last_snapshots is None or len(snapshots) != len(self.last_snapshots) or \
+           any(new[0] is not old[0] or new[1:] != old[1:] for new, old in zip(snapshots, self.last_snapshots)):
+            self.last_buffer = self._compose(snapshots)
+            self.last_snapshots = snapshots
+            self.redraws += 1
+        profiler.record("overlay/frame", time.perf_counter() - ost)
+
+        # Shares the last buffer's memory; only the timestamps are new.
+        buffer = self.last_buffer.copy_region(Gst.BufferCopyFlags.MEMORY, 0, self.last_buffer.get_size())
+        buffer.pts = int(self.k * Gst.SECOND / self.framerate)
+        buffer.duration = int(Gst.SECOND / self.framerate)
+        appsrc.emit("push-buffer", buffer)
+
+        self.last_pos = self.k / self.framerate
+        self.k += 1
+        self.frames_processed += 1
+        self.time_in_cairo += time.time() - tst
+
+class RenderJournal:
+    """
+    Keeps track of which fragments of a checkpointed render have been
+    completely written, and what part of the source each one covers, so
+    that an interrupted render can carry on from the end of the last one.
+    The journal is only good for the same `segment` of the same source,
+    rendered from the same `inputs` (see RenderEngineGstreamer.set_inputs);
+    fragments left over from anything else are thrown away.
+    """
+    def __init__(self, path, segment, inputs = None):
+        self.path = path
+        self.segment = list(segment) if segment is not None else None
+        # Round-trip through JSON, so that this compares equal to what we
+        # read back from the journal.
+        self.inputs = json.loads(json.dumps(inputs, sort_keys=True, default=str))
+        self.fragments = []
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            if data['segment'] == self.segment and data.get('inputs') == self.inputs:
+                self.fragments = data['fragments']
+            else:
+                logger.info(f"{path} is from a render of something else; starting over")
+                for fragment in data['fragments']:
+                    if os.path.exists(fragment['location']):
+                        os.unlink(fragment['location'])
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"render journal {path} is unreadable ({e}); starting over")
+
+    def resume_time(self):
+        """Where in the source the next fragment should start, or None to
+        start at the beginning."""
+        if not self.fragments:
+            return None
+        return self.fragments[-1]['stop']
+
+    def add(self, location, start, stop):
+        self.fragments.append({ 'location': location, 'start': start, 'stop': stop })
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(self.path)))
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({ 'segment': self.segment, 'inputs': self.inputs, 'fragments': self.fragments }, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except:
+            os.unlink(tmp_path)
+            raise
+
+    def remove(self):
+        for fragment in self.fragments:
+            os.unlink(fragment['location'])
+        os.unlink(self.path)
+
 class RenderEngineGstreamer:
-    def __init__(self, renderfn, adjust_time_offset = None):
+    def __init__(self, renderfn, adjust_time_offset = None, prepare_timeline = None, render_stats = None, render_tiles = None, new_tile_renderer = None):
         self.renderfn = renderfn
         self.adjust_time_offset = adjust_time_offset
+        self.prepare_timeline = prepare_timeline
+        self.render_stats = render_stats
+        self.render_tiles = render_tiles
+        self.new_tile_renderer = new_tile_renderer
+        self.progress = None
         self.tweaks = {}
+        self.inputs = None
+        self.factory = None
 
 
     def set_tweaks(self, tweaks):
         self.tweaks = tweaks
 
+    def set_inputs(self, inputs):
+        """Tells the engine what went into the next render (anything
+        JSON-serializable; renda uses its build manifest's fingerprint), so
+        that checkpoints left behind by a render of different inputs are
+        thrown away rather than resumed from."""
+        self.inputs = inputs
+
+    def set_factory(self, factory):
+        """Gives the engine a way to build another one like it, in another
+        process: `factory` is a picklable callable that returns an engine
+        with the same callbacks (see gpsrenda.session.clip_engine).  Clips
+        can only be rendered in pieces (see gpsrenda.video.segments) if
+        this has been set."""
+        self.factory = factory
+
+    def set_progress(self, progress):
+        """If set, renders call `progress(pos, dur)` (in seconds of video)
+        every so often, rather than printing a progress line.  Renders that
+        are split into pieces also pass `piece = n`."""
+        self.progress = progress
+
+    def _profile_stats(self):
+        """A summary of the profile so far, for the progress line."""
+        if not profiler.enabled:
+            return ""
+        names = list(profiler.histograms)
+        fetch = sum(profiler.p50(name) or 0 for name in names if name.endswith("/fetch"))
+        draw = sum(profiler.p50(name) or 0 for name in names if name.endswith("/draw"))
+        stats = f"; p50 widget fetch {fetch * 1e6:.0f} µs, draw {draw * 1e6:.0f} µs"
+        if profiler.p50("gst/map") is not None:
+            stats += f", map {profiler.p50('gst/map') * 1e6:.0f} µs"
+        if profiler.p50("queue/decode_queue/buffers") is not None:
+            stats += f", decode queue {profiler.p50('queue/decode_queue/buffers'):.0f} frames"
+        return stats
+
+    def render_trial(self, src, dest, seconds):
+        """Renders just the first `seconds` of a clip, quietly, and returns
+        the same statistics that render() does.  Used to try out settings
+        (see gpsrenda.video.autotune)."""
+        progress = self.progress
+        self.progress = lambda pos, dur, piece = None: None
+        try:
+            return self._render_one(src, dest, segment = (0, seconds))
+        finally:
+            self.progress = progress
+
+    def _make_prerenderer(self):
+        overlay_threads = globals['video']['gstreamer']['overlay_threads']
+        if overlay_threads > 0 and self.new_tile_renderer is not None:
+            logger.debug(f"rendering overlay on {overlay_threads} worker threads")
+            return OverlayPrerenderer(self.new_tile_renderer, overlay_threads)
+        return None
+
+    def _run(self, pipeline, gpsoverlay = None, duration = None, segment = None, label = "", on_element = None):
+        """Runs a pipeline to completion, printing progress as we go.  If
+        `duration` (in seconds) is given, it is used for the progress
+        display instead of asking the pipeline how long it is.  If
+        `segment` is a (start, stop) pair of times in seconds, only that
+        part of the input is played (stop may be None, for "until the
+        end").  Element messages are passed to `on_element`, if given.
+        Returns how long the pipeline took to run, in seconds."""
+        pipeline.use_clock(None)
+
+        loop = GLib.MainLoop()
+        def on_message(bus, message):
+            mtype = message.type
+            if mtype == Gst.MessageType.STATE_CHANGED:
+                pass
+            elif mtype == Gst.MessageType.EOS:
+                print("\nEOS")
+                pipeline.set_state(Gst.State.NULL)
+                loop.quit()
+            elif mtype == Gst.MessageType.ERROR:
+                # A pipeline that has failed never gets to EOS, so stop it
+                # here, or we would wait for it forever.
+                (err, debug) = message.parse_error()
+                logger.error(f"{label}pipeline error from {message.src.get_name()}: {err.message} ({debug})")
+                nonlocal failed
+                failed = err.message
+                pipeline.set_state(Gst.State.NULL)
+                loop.quit()
+            elif mtype == Gst.MessageType.WARNING:
+                print("\nWarning!")
+            elif mtype == Gst.MessageType.ELEMENT and on_element is not None:
+                on_element(message)
+            return True
+
+        failed = False
+        bus = pipeline.get_bus()
+        bus.connect("message", on_message)
+        bus.add_signal_watch()
+
+        starttime = time.time()
+        alldone = False
+        def on_timer():
+            if alldone:
+                return False
+            (_, pos) = pipeline.query_position(Gst.Format.TIME)
+            (_, dur) = pipeline.query_duration(Gst.Format.TIME)
+            if duration is not None:
+                dur = duration * Gst.SECOND
+            if segment is not None:
+                pos -= segment[0] * Gst.SECOND
+            if self.progress is not None:
+                if dur > 1000:
+                    self.progress(max(pos, 0) / Gst.SECOND, dur / Gst.SECOND)
+                return True
+            now = time.time() - starttime
+            if dur <= 1000 or now <= 1:
+                print("starting up...", end='\r')
+                return True
+            now = datetime.timedelta(seconds = now)
+            pos = datetime.timedelta(microseconds = pos / 1000)
+            dur = datetime.timedelta(microseconds = dur / 1000)
+            if self.render_stats:
+                cache_stats = "; tile cache hits: " + ", ".join([ f"{name} {hits / (hits + misses + 0.01) * 100:.0f}%" for name, hits, misses in self.render_stats() ])
+            else:
+                cache_stats = ""
+            if gpsoverlay is not None:
+                copy_stats = f", {gpsoverlay.buffer_copies} buffer copies" if gpsoverlay.buffer_copies else ""
+                frame_stats = f"; {gpsoverlay.frames_processed} frames{copy_stats}, {gpsoverlay.time_in_cairo / (gpsoverlay.frames_processed + 0.01) * 1000:.1f} ms avg in Cairo / frame{cache_stats}{self._profile_stats()}"
+            else:
+                frame_stats = ""
+            print(f"{label}{pos / dur * 100:.1f}% ({pos/now:.2f}x realtime; {pos} / {dur}{frame_stats})", end='\r')
+            return True
+        GLib.timeout_add(200, on_timer)
+
+        if profiler.enabled:
+            # See how full the queues on either side of the overlay are: a
+            # full decode queue means that we are waiting on the overlay or
+            # the encoder, and an empty one means that we are waiting on
+            # the decoder.
+            queues = [ elt for elt in [ pipeline.get_by_name("decode_queue"), pipeline.get_by_name("encode_queue") ] if elt is not None ]
+            def sample_queues():
+                if alldone:
+                    return False
+                for queue in queues:
+                    profiler.record(f"queue/{queue.get_name()}/buffers", queue.get_property("current-level-buffers"))
+                    profiler.record(f"queue/{queue.get_name()}/bytes", queue.get_property("current-level-bytes"))
+                return True
+            GLib.timeout_add(50, sample_queues)
+
+        if segment is not None:
+            # We can only seek once the pipeline has prerolled.
+            pipeline.set_state(Gst.State.PAUSED)
+            pipeline.get_state(Gst.CLOCK_TIME_NONE)
+            (start, stop) = segment
+            pipeline.seek(1.0, Gst.Format.TIME, Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE,
+                          Gst.SeekType.SET, int(start * Gst.SECOND),
+                          Gst.SeekType.NONE if stop is None else Gst.SeekType.SET, -1 if stop is None else int(stop * Gst.SECOND))
+
+        pipeline.set_state(Gst.State.PLAYING)
+
+        interrupted = False
+        def shutdown_loop(*args):
+            nonlocal interrupted
+            interrupted = True
+            pipeline.send_event(Gst.Event.new_eos())
+            pipeline.set_state(Gst.State.NULL)
+            loop.quit()
+
+        try:
+            signal.signal(signal.SIGINT, shutdown_loop)
+        except:
+            pass
+
+        try:
+            loop.run()
+        except Exception as e:
+            print(e)
+            shutdown_loop()
+            
+        alldone = True
+        if self.progress is None:
+            print("")
+        if failed:
+            raise RuntimeError(f"pipeline reported an error: {failed}")
+        if interrupted:
+            # Do not let anyone mistake what we wrote for a finished render.
+            raise KeyboardInterrupt()
+        return time.time() - starttime
+
     def render(self, src, dest):
-        """Set up a Gstreamer encode, and run it."""
-        
+        """Set up a Gstreamer encode, and run it.  If
+        globals['video']['gstreamer']['segments'] asks for it, the clip is
+        split into that many pieces, which are rendered in parallel, each
+        in its own process, and then glued back together.
+
+        Returns a dict of statistics about the render: 'output', the file
+        written; 'duration', the length of the clip; 'frames', how many
+        frames were rendered; and 'elapsed', how long that took (both in
+        seconds)."""
+
+        segments = globals['video']['gstreamer']['segments']
+        if segments == 0:
+            segments = os.cpu_count() or 1
+        if segments > 1 and self.factory is not None:
+            return self._render_segments(src, dest, segments)
+        else:
+            if segments > 1:
+                logger.warning(f"no way to render pieces of {src} in other processes; rendering it in one piece")
+            return self._render_one(src, dest)
+
+    def _render_segments(self, src, dest, segments):
+        tweaks = merge_dict({}, globals['video'])
+        tweaks = merge_dict(tweaks, self.tweaks)
+        input = VideoSourceGoPro(src, tweaks = tweaks)
+        tst = time.time()
+
+        ranges = split_points(input.duration(), input.keyframes(), segments)
+        logger.debug(f"rendering {src} in {len(ranges)} pieces: {', '.join(f'{start:.1f}s' for start, _ in ranges)}")
+
+        # Pieces are only moved into place once they are complete, so if we
+        # were interrupted, we can pick up where we left off.  (The cuts
+        # only depend on the source and the number of pieces, so they are
+        # the same the next time around.)
+        pieces = [ f"{dest}.part{i}of{len(ranges)}.mp4" for i in range(len(ranges)) ]
+        children = []
+        for i, (segment, piece) in enumerate(zip(ranges, pieces)):
+            if os.path.exists(piece):
+                logger.debug(f"piece {i + 1} of {src} is already rendered; reusing it")
+                continue
+            job = {
+                'factory': self.factory,
+                'globals': globals,
+                'log_level': logging.getLogger('gpsrenda').getEffectiveLevel(),
+                'tweaks': self.tweaks,
+                'inputs': self.inputs,
+                'src': src,
+                'dest': piece,
+                'segment': segment,
+                'label': f"[{i + 1}/{len(ranges)}] ",
+            }
+            children.append(PieceProcess(job, partial(self.progress, piece = i) if self.progress is not None else None))
+
+        failed = False
+        for child in children:
+            if not child.wait():
+                failed = True
+        if failed:
+            raise RuntimeError(f"rendering one or more pieces of {src} failed; leaving pieces in place")
+
+        self._concat(pieces, dest)
+        for piece in pieces:
+            os.unlink(piece)
+        if profiler.enabled:
+            # Each piece's process profiled itself, next to the piece as it
+            # was being written.
+            combine_dumps([ f"{piece}.partial.profile.json" for piece in pieces ], f"{dest}.profile.json")
+
+        duration = input.duration()
+        return { 'output': dest, 'duration': duration, 'frames': int(round(duration * input.framerate)), 'elapsed': time.time() - tst }
+
+    def _concat(self, pieces, dest):
+        """Glues a list of mp4 files, each with one H.264 video track and
+        one audio track, together end to end, without re-encoding them."""
+        pipeline = Gst.Pipeline.new("pipeline")
+
+        def mkelt(eltype):
+            elt = Gst.ElementFactory.make(eltype, None)
+            assert elt
+            pipeline.add(elt)
+            return elt
+
+        vconcat = mkelt("concat")
+        aconcat = mkelt("concat")
+
+        for piece in pieces:
+            filesrc = mkelt("filesrc")
+            filesrc.set_property("location", piece)
+            qtdemux = mkelt("qtdemux")
+            assert(filesrc.link(qtdemux))
+
+            # Request the sink pads now, so that the pieces are played in
+            # order, however their pads happen to show up.
+            vpad = vconcat.get_request_pad("sink_%u")
+            apad = aconcat.get_request_pad("sink_%u")
+            def qtdemux_pad_callback(qtdemux, pad, vpad = vpad, apad = apad):
+                name = pad.get_name()
+                if name.startswith("video_"):
+                    pad.link(vpad)
+                elif name.startswith("audio_"):
+                    pad.link(apad)
+                else:
+                    print(f"qtdemux unknown output pad {name}?")
+            qtdemux.connect("pad-added", qtdemux_pad_callback)
+
+        # Each piece was encoded separately, so its SPS / PPS may differ;
+        # keep them in-band, so that the muxer does not have to care.
+        parse = mkelt("h264parse")
+        assert(vconcat.link(parse))
+        capsfilter = mkelt("capsfilter")
+        capsfilter.set_property('caps', Gst.Caps.from_string("video/x-h264,stream-format=avc3,alignment=au"))
+        assert(parse.link(capsfilter))
+
+        mp4mux = mkelt("mp4mux")
+        capsfilter.link(mp4mux)
+        aconcat.link(mp4mux)
+
+        filesink = mkelt("filesink")
+        filesink.set_property("location", dest)
+        mp4mux.link(filesink)
+
+        logger.debug(f"concatenating {len(pieces)} pieces into {dest}")
+        self._run(pipeline, label = "[concat] ")
+
+    def _render_one(self, src, dest, segment = None, label = ""):
+        profiler.reset()
         tweaks = merge_dict({}, globals['video'])
         tweaks = merge_dict(tweaks, self.tweaks)
 
         input = VideoSourceGoPro(src, tweaks = tweaks)
+        if segment is not None:
+            (start, stop) = segment
+            duration = (stop if stop is not None else input.duration()) - start
+        else:
+            (start, duration) = (0, input.duration())
+        if self.prepare_timeline:
+            self.prepare_timeline(input.start_time() + start, duration, input.framerate)
+
+        # If we are checkpointing, the output is written as a series of
+        # fragments, which are glued together at the end; if we were
+        # interrupted last time, pick up after the last complete one.
+        checkpoint_interval = globals['video']['gstreamer']['checkpoint_interval']
+        journal = None
+        if checkpoint_interval:
+            journal = RenderJournal(f"{dest}.part-journal.json", segment, self.inputs)
+            resume_time = journal.resume_time()
+            if resume_time is not None:
+                logger.debug(f"resuming {src} at {resume_time:.1f}s, after {len(journal.fragments)} complete fragments")
+                segment = (resume_time, segment[1] if segment is not None else None)
+
+        compositing = globals['video']['gstreamer']['overlay_compositing']
+        if compositing == 'gl' and (self.render_tiles is None or not Gst.ElementFactory.find("glvideomixer")):
+            logger.warning(f"cannot composite the overlay with OpenGL here (no glvideomixer, or no tiles to composite); drawing it into the frames instead")
+            compositing = 'cpu'
+        elif compositing == 'meta' and (self.render_tiles is None or not Gst.ElementFactory.find("gloverlaycompositor")):
+            logger.warning(f"cannot composite the overlay as metadata here (no gloverlaycompositor, or no tiles to composite); drawing it into the frames instead")
+            compositing = 'cpu'
+        elif compositing not in ('cpu', 'gl', 'meta'):
+            raise ValueError(f"unknown overlay compositing method {compositing}")
 
         pipeline = Gst.Pipeline.new("pipeline")
 
-        (aout, vout) = input.add_to_pipeline(pipeline)
+        (aout, vout) = input.add_to_pipeline(pipeline, gl_memory = compositing in ('gl', 'meta'))
 
         def mkelt(eltype):
             elt = Gst.ElementFactory.make(eltype, None)
@@ -381,9 +1160,57 @@ class RenderEngineGstreamer:
             pipeline.add(elt)
             return elt
 
-        gpsoverlay = GstOverlayGPS(self.renderfn, input.start_time())
-        pipeline.add(gpsoverlay)
-        assert(vout.link(gpsoverlay))
+        prerenderer = self._make_prerenderer()
+        if compositing == 'gl':
+            # The video stays in (or goes once into) GL memory, and the
+            # overlay, which is much smaller, is uploaded next to it.
+            logger.debug(f"compositing overlay with OpenGL ({'decoded into GL memory' if input.gl_output else 'uploading decoded frames'})")
+            if not input.gl_output:
+                upload = mkelt("glupload")
+                assert(vout.link(upload))
+                vout = upload
+            mixer = mkelt("glvideomixer")
+            video_pad = mixer.get_request_pad("sink_%u")
+            video_pad.set_property("zorder", 0)
+            assert(vout.get_static_pad("src").link(video_pad) == Gst.PadLinkReturn.OK)
+
+            stop = segment[1] if segment is not None and segment[1] is not None else input.duration()
+            gpsoverlay = OverlayTexture(self.render_tiles, input.start_time(), input.framerate, stop, prerenderer = prerenderer)
+            overlay_src = gpsoverlay.add_to_pipeline(pipeline)
+            overlay_upload = mkelt("glupload")
+            assert(overlay_src.link(overlay_upload))
+            overlay_pad = mixer.get_request_pad("sink_%u")
+            (x, y, w, h) = gpsoverlay.bounds
+            overlay_pad.set_property("zorder", 1)
+            overlay_pad.set_property("xpos", x)
+            overlay_pad.set_property("ypos", y)
+            overlay_pad.set_property("width", w)
+            overlay_pad.set_property("height", h)
+            assert(overlay_upload.get_static_pad("src").link(overlay_pad) == Gst.PadLinkReturn.OK)
+            overlay_out = mixer
+        elif compositing == 'meta':
+            # The overlay rides along with each frame, untouched, until
+            # gloverlaycompositor blends it in on the GPU.  glupload and
+            # glcolorconvert pass the metadata through.
+            logger.debug(f"attaching overlay as composition metadata ({'decoded into GL memory' if input.gl_output else 'uploading decoded frames'})")
+            gpsoverlay = GstOverlayCompositionGPS(self.render_tiles, input.start_time(), prerenderer = prerenderer, framerate = input.framerate)
+            pipeline.add(gpsoverlay)
+            assert(vout.link(gpsoverlay))
+            vout = gpsoverlay
+            if not input.gl_output:
+                upload = mkelt("glupload")
+                assert(vout.link(upload))
+                vout = upload
+            # gloverlaycompositor only takes RGBA.
+            convert = mkelt("glcolorconvert")
+            assert(vout.link(convert))
+            overlay_out = mkelt("gloverlaycompositor")
+            assert(convert.link(overlay_out))
+        else:
+            gpsoverlay = GstOverlayGPS(self.renderfn, input.start_time(), prerenderer = prerenderer, framerate = input.framerate)
+            pipeline.add(gpsoverlay)
+            assert(vout.link(gpsoverlay))
+            overlay_out = gpsoverlay
 
         encoder = globals['video']['gstreamer']['encoder']
         if encoder is None:
@@ -397,17 +1224,27 @@ class RenderEngineGstreamer:
                 logger.debug(f"no hardware accelerated encoder found; using x264")
                 encoder = 'x264'
 
-        if Gst.ElementFactory.find("vaapipostproc") and globals['video']['gstreamer']['x264_profile'] == 'high':
+        if compositing in ('gl', 'meta'):
+            # Already in GL memory: convert there, and download only if
+            # the encoder needs it.
+            videoconvert = mkelt("glcolorconvert")
+            assert(overlay_out.link(videoconvert))
+            if encoder == 'nvenc':
+                videoconvert_out = videoconvert
+            else:
+                videoconvert_out = mkelt("gldownload")
+                assert(videoconvert.link(videoconvert_out))
+        elif Gst.ElementFactory.find("vaapipostproc") and globals['video']['gstreamer']['x264_profile'] == 'high':
             # vaapipostproc doesn't seem to be able to output yuv444 / yuv422p?
             logger.debug(f"using VAAPI hardware accelerated colorspace conversion")
             videoconvert_out = mkelt("vaapipostproc")
-            assert(gpsoverlay.link(videoconvert_out))
+            assert(overlay_out.link(videoconvert_out))
         elif Gst.ElementFactory.find("d3d11convert"):
             # glupload is faster on Windows, but d3d11upload actually gets
             # the buffers right...  sigh
             logger.debug(f"using Direct3D hardware accelerated colorspace conversion")
             videoconvert_upload = mkelt("d3d11upload")
-            assert(gpsoverlay.link(videoconvert_upload))
+            assert(overlay_out.link(videoconvert_upload))
             videoconvert = mkelt("d3d11convert")
             assert(videoconvert_upload.link(videoconvert))
             videoconvert_out = mkelt("d3d11download")
@@ -415,7 +1252,7 @@ class RenderEngineGstreamer:
         elif Gst.ElementFactory.find("glcolorconvert"):
             logger.debug(f"using OpenGL hardware accelerated colorspace conversion")
             videoconvert_upload = mkelt("glupload")
-            assert(gpsoverlay.link(videoconvert_upload))
+            assert(overlay_out.link(videoconvert_upload))
             videoconvert = mkelt("glcolorconvert")
             assert(videoconvert_upload.link(videoconvert))
             if encoder == 'nvenc':
@@ -425,7 +1262,7 @@ class RenderEngineGstreamer:
                 assert(videoconvert.link(videoconvert_out))
         else:
             videoconvert_out = mkelt("videoconvert")
-            assert(gpsoverlay.link(videoconvert_out))
+            assert(overlay_out.link(videoconvert_out))
 
         if encoder == "nvenc":
             videoenc = mkelt("nvh264enc")
@@ -476,76 +1313,153 @@ class RenderEngineGstreamer:
         else:
             raise RuntimeError(f"unknown encode method {encoder}")
 
-        videoq = mkelt("queue")
+        videoq = Gst.ElementFactory.make("queue", "encode_queue")
+        pipeline.add(videoq)
         assert(videoenc.link(videoq))
 
-        mp4mux = mkelt("mp4mux")
-        videoq.link(mp4mux)
-        aout.link(mp4mux)
+        on_element = None
+        if journal is None:
+            mp4mux = mkelt("mp4mux")
+            videoq.link(mp4mux)
+            aout.link(mp4mux)
 
-        filesink = mkelt("filesink")
-        filesink.set_property("location", dest)
-        mp4mux.link(filesink)
+            filesink = mkelt("filesink")
+            filesink.set_property("location", dest)
+            mp4mux.link(filesink)
+        else:
+            # splitmuxsink asks the encoder for a keyframe at each
+            # boundary, so every fragment can stand on its own.
+            splitmux = mkelt("splitmuxsink")
+            splitmux.set_property("location", f"{dest}.part-frag%05d.mp4")
+            splitmux.set_property("start-index", len(journal.fragments))
+            splitmux.set_property("max-size-time", int(checkpoint_interval * Gst.SECOND))
+            splitmux.set_property("send-keyframe-requests", True)
+            assert(videoq.get_static_pad("src").link(splitmux.get_request_pad("video")) == Gst.PadLinkReturn.OK)
+            assert(aout.get_static_pad("src").link(splitmux.get_request_pad("audio_%u")) == Gst.PadLinkReturn.OK)
+
+            fragment_start = segment[0] if segment is not None else 0
+            def on_element(message):
+                nonlocal fragment_start
+                st = message.get_structure()
+                if st is None or st.get_name() != "splitmuxsink-fragment-closed":
+                    return
+                # Running time counts from wherever we started this time.
+                fragment_stop = (segment[0] if segment is not None else 0) + st.get_value("running-time") / Gst.SECOND
+                journal.add(st.get_string("location"), fragment_start, fragment_stop)
+                fragment_start = fragment_stop
+
+        if segment is not None:
+            run_duration = (segment[1] if segment[1] is not None else input.duration()) - segment[0]
+        else:
+            run_duration = None
+        try:
+            elapsed = self._run(pipeline, gpsoverlay, duration = run_duration, segment = segment, label = label, on_element = on_element)
+        finally:
+            if prerenderer:
+                prerenderer.shutdown()
+        if compositing in ('gl', 'meta'):
+            logger.debug(f"redrew the overlay for {gpsoverlay.redraws} of {gpsoverlay.frames_processed} frames")
+
+        if journal is not None:
+            self._concat([ fragment['location'] for fragment in journal.fragments ], dest)
+            journal.remove()
+
+        if profiler.enabled:
+            profiler.dump(f"{dest}.profile.json")
+
+        return { 'output': dest, 'duration': duration, 'frames': gpsoverlay.frames_processed, 'elapsed': elapsed }
+
+    def render_overlay(self, src, dest):
+        """Render only the overlay for a video, onto transparent frames,
+        without decoding (or re-encoding) the video itself.  All we need
+        from the source is its start time, duration, frame rate, and frame
+        size.  Depending on globals['video']['gstreamer']['overlay_format'],
+        this writes either a QuickTime Animation (qtrle) .mov with an alpha
+        channel, a directory of PNGs, or a directory of only the distinct
+        PNGs plus a manifest (see gpsrenda.video.sparse), next to `dest`
+        (which should have no extension).  Returns statistics about the
+        render, like render() does."""
+
+        profiler.reset()
+        tweaks = merge_dict({}, globals['video'])
+        tweaks = merge_dict(tweaks, self.tweaks)
 
-        pipeline.use_clock(None)
+        input = VideoSourceGoPro(src, tweaks = tweaks)
+        start_time = input.start_time()
+        duration = input.duration()
+        (width, height) = input.dimensions()
+        framerate = Fraction(input.framerate).limit_denominator(1001)
+        if self.prepare_timeline:
+            self.prepare_timeline(start_time, duration, input.framerate)
+
+        overlay_format = globals['video']['gstreamer']['overlay_format']
+        if overlay_format == 'sparse':
+            # Deduplicating frames does not need a pipeline at all.
+            if self.render_tiles is None:
+                raise RuntimeError("sparse overlay output needs a tile renderer")
+            tst = time.time()
+            manifest = render_sparse_overlay(self.render_tiles, start_time, duration, input.framerate, width, height, dest)
+            return { 'output': dest, 'duration': duration, 'frames': manifest['frames'], 'elapsed': time.time() - tst }
 
-        loop = GLib.MainLoop()
-        def on_message(bus, message):
-            mtype = message.type
-            if mtype == Gst.MessageType.STATE_CHANGED:
-                pass
-            elif mtype == Gst.MessageType.EOS:
-                print("\nEOS")
-                pipeline.set_state(Gst.State.NULL)
-                loop.quit()
-            elif mtype == Gst.MessageType.ERROR:
-                print("\nError!")
-            elif mtype == Gst.MessageType.WARNING:
-                print("\nWarning!")
-            return True
+        pipeline = Gst.Pipeline.new("pipeline")
 
-        bus = pipeline.get_bus()
-        bus.connect("message", on_message)
-        bus.add_signal_watch()
+        def mkelt(eltype):
+            elt = Gst.ElementFactory.make(eltype, None)
+            assert elt
+            pipeline.add(elt)
+            return elt
 
-        starttime = time.time()
-        alldone = False
-        def on_timer():
-            if alldone:
-                return False
-            (_, pos) = pipeline.query_position(Gst.Format.TIME)
-            (_, dur) = pipeline.query_duration(Gst.Format.TIME)
-            now = time.time() - starttime
-            if dur <= 1000 or now <= 1:
-                print("starting up...", end='\r')
-                return True
-            now = datetime.timedelta(seconds = now)
-            pos = datetime.timedelta(microseconds = pos / 1000)
-            dur = datetime.timedelta(microseconds = dur / 1000)
-            print(f"{pos / dur * 100:.1f}% ({pos/now:.2f}x realtime; {pos} / {dur}; {gpsoverlay.frames_processed} frames, {gpsoverlay.time_in_cairo / (gpsoverlay.frames_processed + 0.01) * 1000:.1f} ms avg in Cairo / frame)", end='\r')
-            return True
-        GLib.timeout_add(200, on_timer)
+        videosrc = mkelt("videotestsrc")
+        videosrc.set_property("pattern", "solid-color")
+        videosrc.set_property("foreground-color", 0x00000000)
+        videosrc.set_property("num-buffers", int(round(duration * input.framerate)))
 
-        pipeline.set_state(Gst.State.PLAYING)
+        capsfilter = mkelt("capsfilter")
+        capsfilter.set_property('caps', Gst.Caps.from_string(f"video/x-raw,format=BGRA,width={width},height={height},framerate={framerate.numerator}/{framerate.denominator}"))
+        assert(videosrc.link(capsfilter))
 
-        def shutdown_loop(*args):
-            pipeline.send_event(Gst.Event.new_eos())
-            pipeline.set_state(Gst.State.NULL)
-            loop.quit()
+        prerenderer = self._make_prerenderer()
+        gpsoverlay = GstOverlayGPS(self.renderfn, start_time, prerenderer = prerenderer, framerate = input.framerate, straight_alpha = True)
+        pipeline.add(gpsoverlay)
+        assert(capsfilter.link(gpsoverlay))
 
-        try:
-            signal.signal(signal.SIGINT, shutdown_loop)
-        except:
-            pass
+        if overlay_format == 'png':
+            os.makedirs(dest, exist_ok = True)
+            dest = os.path.join(dest, "%06d.png")
 
-        try:
-            loop.run()
-        except Exception as e:
-            print(e)
-            shutdown_loop()
-            
-        alldone = True
-        print("")
+            videoenc = mkelt("pngenc")
+            assert(gpsoverlay.link(videoenc))
+
+            filesink = mkelt("multifilesink")
+            filesink.set_property("location", dest)
+            assert(videoenc.link(filesink))
+        elif overlay_format == 'qtrle':
+            dest = dest + ".mov"
+
+            videoconvert = mkelt("videoconvert")
+            assert(gpsoverlay.link(videoconvert))
+
+            videoenc = mkelt("avenc_qtrle")
+            assert(videoconvert.link(videoenc))
+
+            qtmux = mkelt("qtmux")
+            assert(videoenc.link(qtmux))
+
+            filesink = mkelt("filesink")
+            filesink.set_property("location", dest)
+            assert(qtmux.link(filesink))
+        else:
+            raise RuntimeError(f"unknown overlay output format {overlay_format}")
+
+        logger.debug(f"rendering {width}x{height} overlay for {duration:.1f}s at {float(framerate):.3f} fps to {dest}")
+        elapsed = self._run(pipeline, gpsoverlay, duration = duration)
+        if profiler.enabled:
+            profiler.dump(f"{dest}.profile.json")
+
+        if prerenderer:
+            prerenderer.shutdown()
+
+        return { 'output': dest, 'duration': duration, 'frames': gpsoverlay.frames_processed, 'elapsed': elapsed }
 
     def preview(self, src, seek = 0.0):
         """Set up a Gstreamer preview pipeline, and begin playing it."""
@@ -554,6 +1468,8 @@ class RenderEngineGstreamer:
         tweaks = merge_dict(tweaks, self.tweaks)
 
         input = VideoSourceGoPro(src, tweaks = tweaks)
+        if self.prepare_timeline:
+            self.prepare_timeline(input.start_time(), input.duration(), input.framerate)
         gpsoverlay = GstOverlayGPS(self.renderfn, input.start_time())
 
         pipeline = Gst.Pipeline.new("pipeline")
@@ -1,4 +1,5 @@
 import logging
+import time
 
 import moviepy.editor as mpy
 import cairo
@@ -11,13 +12,45 @@ from .engines import register_engine
 
 logger = logging.getLogger(__name__)
 
+def _blend_tile(frame, tile):
+    """Composites a Tile onto part of an RGB frame, in place."""
+    (x, y, w, h) = tile.bounds
+    fh, fw = frame.shape[:2]
+    x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + w, fw), min(y + h, fh)
+    if x1 <= x0 or y1 <= y0:
+        return
+
+    # cairo's ARGB32 is premultiplied, and BGRA in memory.
+    stride = tile.surface.get_stride()
+    bgra = np.ndarray(shape=(h, w, 4), dtype=np.uint8, buffer=tile.surface.get_data(), strides=(stride, 4, 1))
+    bgra = bgra[y0 - y:y1 - y, x0 - x:x1 - x]
+    src_rgb = bgra[:,:,2::-1].astype(np.float32) * tile.alpha
+    src_a = bgra[:,:,3:4].astype(np.float32) * (tile.alpha / 255)
+
+    dst = frame[y0:y1, x0:x1]
+    dst[...] = np.clip(src_rgb + dst * (1.0 - src_a) + 0.5, 0, 255).astype(np.uint8)
+
 class RenderEngineMoviepy:
-    def __init__(self, renderfn, adjust_time_offset = None):
+    def __init__(self, renderfn, adjust_time_offset = None, prepare_timeline = None, render_stats = None, render_tiles = None, new_tile_renderer = None):
         self.renderfn = renderfn
+        self.prepare_timeline = prepare_timeline
+        self.render_tiles = render_tiles
     
     def set_tweaks(self, tweaks):
         pass
 
+    def set_inputs(self, inputs):
+        # moviepy renders cannot be resumed.
+        pass
+
+    def set_factory(self, factory):
+        # moviepy renders are never split into pieces.
+        pass
+
+    def set_progress(self, progress):
+        # moviepy prints its own progress bar.
+        pass
+
     def _mkclip(self, src):
         clip = mpy.VideoFileClip(src)
         if globals['video']['force_rotation'] is not None:
@@ -25,9 +58,19 @@ class RenderEngineMoviepy:
             if is_flipped(src) != want_flipped:
                 clip = clip.rotate(180)
         start_t = timestamp_to_seconds(extract_start_time(src))
+        if self.prepare_timeline:
+            self.prepare_timeline(start_t, clip.duration, clip.fps)
 
         def make_frame(t):
             frame = clip.get_frame(t)
+            if self.render_tiles is not None:
+                # Blend each widget's tile into just the part of the frame
+                # that it covers.
+                out_frame = frame.copy()
+                for tile in self.render_tiles(t + start_t):
+                    _blend_tile(out_frame, tile)
+                return out_frame
+
             h, w = frame.shape[:2]
             alpha = np.zeros((h, w, 1), dtype=frame.dtype)
             argb_frame = np.concatenate([frame[:,:,::-1], alpha], axis=-1)
@@ -48,6 +91,7 @@ class RenderEngineMoviepy:
 
     def render(self, src, dest):
         clip, outclip = self._mkclip(src)
+        tst = time.time()
 
         outclip.audio = clip.audio
         outclip.write_videofile(
@@ -60,6 +104,8 @@ class RenderEngineMoviepy:
             ]
         )
 
+        return { 'output': dest, 'duration': clip.duration, 'frames': int(round(clip.duration * clip.fps)), 'elapsed': time.time() - tst }
+
     def preview(self, src, seek = 0.0):
         clip, outclip = self._mkclip(src)
         outclip.resize((960, 640)).preview(fps=15, audio=False)
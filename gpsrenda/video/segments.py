@@ -0,0 +1,111 @@
+"""
+Rendering a long clip in pieces, in parallel.
+
+RenderEngineGstreamer.render() can cut a clip into pieces at keyframes,
+render each piece at the same time, and glue them back together.  Each
+piece is rendered by a new Python process, rather than by a fork of the
+one that is running: by then, GLib and GStreamer have threads of their own
+(and so may a batch worker, or a render or autotune that came before), and
+a forked child gets only a copy of the thread that forked it, along with
+any locks that the others happened to be holding.
+
+The new process is told what to render by a pickled job on its standard
+input; the job includes a factory that builds an engine like the parent's
+(see RenderEngineGstreamer.set_factory).  If the parent wants to hear how
+far along the piece is, the child writes "pos dur" lines, in seconds, to
+a pipe that it is handed.
+"""
+
+import logging
+import os
+import pickle
+import subprocess
+import sys
+import threading
+
+from gpsrenda.globals import set_globals
+
+logger = logging.getLogger(__name__)
+
+def split_points(duration, keyframes, segments):
+    """Chooses where to cut a clip of `duration` seconds into `segments`
+    pieces of about the same length, snapping each cut to the nearest of
+    `keyframes` (in seconds; if there are none, the cuts are wherever they
+    fall), so that every piece starts cleanly.  Returns a list of (start,
+    stop) pairs, with None for the end of the clip."""
+    cuts = []
+    for i in range(1, segments):
+        target = duration * i / segments
+        if not keyframes:
+            cut = target
+        else:
+            cut = min(keyframes, key = lambda kf: abs(kf - target))
+        if cut > (cuts[-1] if cuts else 0):
+            cuts.append(cut)
+    starts = [0] + cuts
+    stops = cuts + [None]
+    return list(zip(starts, stops))
+
+class PieceProcess:
+    """
+    A process rendering one piece of a clip.  `job` is a dict with the
+    'factory' that builds the engine, the 'globals', 'tweaks', and
+    'inputs' to render with, and the 'src', 'dest', 'segment', and
+    'label' to pass to its _render_one().  If `progress` is given, it is
+    called with (pos, dur) as the piece is rendered, from another thread.
+    """
+    def __init__(self, job, progress = None):
+        job = dict(job, progress_fd = None)
+        pass_fds = ()
+        if progress is not None:
+            (rfd, wfd) = os.pipe()
+            job['progress_fd'] = wfd
+            pass_fds = (wfd, )
+
+        # The child has to find gpsrenda wherever we did.
+        env = dict(os.environ, PYTHONPATH = os.pathsep.join(path for path in sys.path if path))
+        self.process = subprocess.Popen([ sys.executable, "-c", "from gpsrenda.video.segments import main; main()" ],
+                                        stdin = subprocess.PIPE, pass_fds = pass_fds, env = env)
+        self.reader = None
+        if progress is not None:
+            os.close(wfd)
+            self.reader = threading.Thread(target = self._read_progress, args = (rfd, progress), daemon = True)
+            self.reader.start()
+        with self.process.stdin as stdin:
+            pickle.dump(job, stdin)
+
+    @staticmethod
+    def _read_progress(fd, progress):
+        with os.fdopen(fd, "r") as f:
+            for line in f:
+                (pos, dur) = line.split()
+                progress(float(pos), float(dur))
+
+    def wait(self):
+        """Waits for the piece to finish; returns whether it succeeded."""
+        status = self.process.wait()
+        if self.reader is not None:
+            self.reader.join()
+        return status == 0
+
+def main():
+    """What a piece's process runs: reads its job from stdin, and renders
+    the piece into `dest`.partial, and then moves it into place."""
+    job = pickle.load(sys.stdin.buffer)
+    logging.basicConfig(format='%(asctime)s %(levelname)s [%(name)s] %(message)s', datefmt="%Y-%m-%d %H:%M:%S")
+    logging.getLogger('gpsrenda').setLevel(job['log_level'])
+
+    set_globals(job['globals'])
+    engine = job['factory']()
+    engine.set_tweaks(job['tweaks'])
+    engine.set_inputs(job['inputs'])
+    if job['progress_fd'] is not None:
+        out = os.fdopen(job['progress_fd'], "w", buffering = 1)
+        engine.set_progress(lambda pos, dur: print(f"{pos} {dur}", file = out))
+
+    try:
+        engine._render_one(job['src'], job['dest'] + ".partial", segment = job['segment'], label = job['label'])
+        os.replace(job['dest'] + ".partial", job['dest'])
+    except:
+        logger.exception(f"while rendering piece {job['label'].strip()} of {job['src']}:")
+        sys.exit(1)
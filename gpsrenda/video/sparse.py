@@ -0,0 +1,114 @@
+"""
+Sparse overlay output: write out only the overlay frames that actually
+differ from each other.
+
+An overlay spends a lot of its time not changing -- at a stop, or when it
+is only made of text gauges that tick over once a second -- so rather
+than encoding every frame, we hash each frame's tiles, write a PNG only
+the first time we see a given set of tiles, and record which PNG to show
+for which run of frames.  The result is a directory with:
+
+  * the unique frames, as 000000.png, 000001.png, ...;
+  * manifest.json, describing the runs of frames in terms of frame
+    numbers; and
+  * overlay.ffconcat, the same thing as a variable-frame-rate ffmpeg
+    concat script, so that `ffmpeg -f concat -i overlay.ffconcat ...` (or
+    an editor that can read image sequences with durations) can turn it
+    back into a stream.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+import cairo
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+class _TileHasher:
+    """Remembers the digest of each tile's surface.  A Tile draws into a
+    new surface whenever its contents change, so as long as the surface is
+    the same object as last time, so is the digest."""
+    def __init__(self):
+        self.digests = {}
+
+    def signature(self, snapshots):
+        sig = []
+        for i, (surface, x, y, alpha) in enumerate(snapshots):
+            (last_surface, digest) = self.digests.get(i, (None, None))
+            if surface is not last_surface:
+                surface.flush()
+                digest = hashlib.blake2b(surface.get_data(), digest_size = 16).hexdigest()
+                self.digests[i] = (surface, digest)
+            sig.append(f"{digest}@{x},{y},{alpha}")
+        return "|".join(sig)
+
+def _compose(snapshots, width, height):
+    surf = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+    ctx = cairo.Context(surf)
+    for (surface, x, y, alpha) in snapshots:
+        ctx.set_source_surface(surface, x, y)
+        ctx.paint_with_alpha(alpha)
+    surf.flush()
+    return surf
+
+def render_sparse_overlay(render_tiles, start_time, duration, framerate, width, height, dest):
+    """Renders the overlay for a clip starting at `start_time` and lasting
+    `duration` seconds into the directory `dest`, writing each distinct
+    frame only once.  `render_tiles(t)` returns the overlay's tiles at
+    time t.  Returns the manifest."""
+    os.makedirs(dest, exist_ok = True)
+
+    nframes = int(round(duration * framerate))
+    hasher = _TileHasher()
+    images = {} # signature -> file name
+    runs = []   # [first frame, frame count, file name]
+
+    tst = time.time()
+    for k in range(nframes):
+        snapshots = [ tile.snapshot() for tile in render_tiles(start_time + k / framerate) ]
+        sig = hasher.signature(snapshots)
+
+        image = images.get(sig)
+        if image is None:
+            image = f"{len(images):06d}.png"
+            _compose(snapshots, width, height).write_to_png(os.path.join(dest, image))
+            images[sig] = image
+
+        if runs and runs[-1][2] == image:
+            runs[-1][1] += 1
+        else:
+            runs.append([k, 1, image])
+
+        if (k % 100) == 0:
+            elapsed = time.time() - tst
+            print(f"{k / nframes * 100:.1f}% ({k / framerate / (elapsed + 0.01):.2f}x realtime; {k} / {nframes} frames, {len(images)} unique)", end='\r')
+    print("")
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'width': width,
+        'height': height,
+        'framerate': framerate,
+        'start_time': start_time,
+        'frames': nframes,
+        'runs': [ { 'first': first, 'count': count, 'image': image } for (first, count, image) in runs ],
+    }
+    with open(os.path.join(dest, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent = 1)
+
+    with open(os.path.join(dest, "overlay.ffconcat"), "w") as f:
+        f.write("ffconcat version 1.0\n")
+        for (first, count, image) in runs:
+            f.write(f"file '{image}'\nduration {count / framerate:.6f}\n")
+        if runs:
+            # The concat demuxer ignores the duration of the last file
+            # unless it is listed again.
+            f.write(f"file '{runs[-1][2]}'\n")
+
+    logger.debug(f"wrote {len(images)} unique overlay frames for {nframes} frames ({len(runs)} runs) to {dest}")
+    return manifest
@@ -61,41 +61,16 @@ class GaugeHorizontal:
 
         self.markers = markers
 
-    def render(self, ctx, val):
-        if (val is None) or np.isnan(val):
-            ctx.push_group()
-            ctx.rectangle(self.x, self.y, self.w, self.h)
-            ctx.set_source(self.bgpattern)
-            ctx.fill()
-            ctx.pop_group_to_source()
-            ctx.paint_with_alpha(0.9)
-            return
-
-        ctx.push_group()
+        self.background = StaticLayer(self.x, self.y, self.w, self.h, self.draw_background)
+        self.chrome = StaticLayer(self.x, self.y, self.w, self.h, self.draw_chrome)
+        self.tile = Tile(self.x, self.y, self.w, self.h)
 
-        # paint a background
+    def draw_background(self, ctx):
         ctx.rectangle(self.x, self.y, self.w, self.h)
         ctx.set_source(self.bgpattern)
         ctx.fill()
 
-        # paint the gauge bar itself
-        cur_rgb = self.gradient.lookup(val)
-        cur_hsv = colorsys.rgb_to_hsv(*cur_rgb)
-        ctx.rectangle(self.x + self.padding, self.y + self.padding, lerp(self.min, 0, self.max, self.gaugew, val),
-                      self.h - self.padding * 2)
-
-        if self.show_gradient:
-            ctx.set_source(self.gradient.pattern)
-            ctx.fill()
-
-            ctx.rectangle(self.x + self.padding, self.y + self.padding, lerp(self.min, 0, self.max, self.gaugew, val),
-                          self.h - self.padding * 2)
-            ctx.set_source_rgba(cur_rgb[0], cur_rgb[1], cur_rgb[2], self.gradient_tint)
-        else:
-            ctx.set_source_rgb(*cur_rgb)
-
-        ctx.fill()
-
+    def draw_chrome(self, ctx):
         # paint any markers
         for marker_name, marker_value in self.markers.items():
             # line
@@ -122,15 +97,46 @@ class GaugeHorizontal:
         ctx.set_source_rgb(0, 0, 0)
         ctx.stroke()
 
-        # render the big numbers
+        self.caption_text.render(ctx, self.caption)
+
+    def render(self, ctx, val):
+        if (val is None) or np.isnan(val):
+            self.tile.render(ctx, None, self.background.paint)
+            return
+
+        # We only need to draw again if the label, the length of the bar in
+        # pixels, or the color of the bar changes.
+        cur_rgb = self.gradient.lookup(val)
+        barw = round(lerp(self.min, 0, self.max, self.gaugew, val))
         text = self.label.format(val = val)
-        self.label_text.color = colorsys.hsv_to_rgb(cur_hsv[0], 0.1, 1.0)
-        self.label_text.render(ctx, text)
+        key = (text, barw, tuple(round(c * 255) for c in cur_rgb))
+        self.tile.render(ctx, key, lambda tctx: self.draw(tctx, text, barw, cur_rgb))
 
-        self.caption_text.render(ctx, self.caption)
+    def draw(self, ctx, text, barw, cur_rgb):
+        # paint a background
+        self.background.paint(ctx)
 
-        ctx.pop_group_to_source()
-        ctx.paint_with_alpha(0.9)
+        # paint the gauge bar itself
+        cur_hsv = colorsys.rgb_to_hsv(*cur_rgb)
+        ctx.rectangle(self.x + self.padding, self.y + self.padding, barw, self.h - self.padding * 2)
+
+        if self.show_gradient:
+            ctx.set_source(self.gradient.pattern)
+            ctx.fill()
+
+            ctx.rectangle(self.x + self.padding, self.y + self.padding, barw, self.h - self.padding * 2)
+            ctx.set_source_rgba(cur_rgb[0], cur_rgb[1], cur_rgb[2], self.gradient_tint)
+        else:
+            ctx.set_source_rgb(*cur_rgb)
+
+        ctx.fill()
+
+        # paint the markers, the surround, and the caption
+        self.chrome.paint(ctx)
+
+        # render the big numbers
+        self.label_text.color = colorsys.hsv_to_rgb(cur_hsv[0], 0.1, 1.0)
+        self.label_text.render(ctx, text)
 
 class GaugeVertical:
     def __init__(self, x, y, w=80, h=400, label='{val:.0f}°F', dummy_label='100°F', data_range=[0, 100],
@@ -169,27 +175,42 @@ class GaugeVertical:
 
         self.bgpattern = make_background_pattern(0, self.y, 0, self.y + self.h)
 
+        self.background = StaticLayer(self.x, self.y, self.w, self.h, self.draw_background)
+        self.chrome = StaticLayer(self.x, self.y, self.w, self.h, self.draw_chrome)
+        self.tile = Tile(self.x, self.y, self.w, self.h)
+
+    def draw_background(self, ctx):
+        ctx.rectangle(self.x, self.y, self.w, self.h)
+        ctx.set_source(self.bgpattern)
+        ctx.fill()
+
+    def draw_chrome(self, ctx):
+        # paint the surround for the gauge cluster
+        ctx.rectangle(self.x + self.padding, self.y + self.padding, self.w - self.padding * 2, self.gaugeh)
+        ctx.set_line_width(4)
+        ctx.set_source_rgb(0, 0, 0)
+        ctx.stroke()
+
     def render(self, ctx, val):
         if (val is None) or np.isnan(val):
-            ctx.push_group()
-            ctx.rectangle(self.x, self.y, self.w, self.h)
-            ctx.set_source(self.bgpattern)
-            ctx.fill()
-            ctx.pop_group_to_source()
-            ctx.paint_with_alpha(0.9)
+            self.tile.render(ctx, None, self.background.paint)
             return
 
-        ctx.push_group()
+        # We only need to draw again if the label, the height of the bar in
+        # pixels, or the color of the bar changes.
+        cur_rgb = self.gradient.lookup(val)
+        barh = round(lerp(self.min, 0, self.max, self.gaugeh, val))
+        text = self.label.format(val = val)
+        key = (text, barh, tuple(round(c * 255) for c in cur_rgb))
+        self.tile.render(ctx, key, lambda tctx: self.draw(tctx, val, text, barh, cur_rgb))
 
+    def draw(self, ctx, val, text, barh, cur_rgb):
         # paint a background
-        ctx.rectangle(self.x, self.y, self.w, self.h)
-        ctx.set_source(self.bgpattern)
-        ctx.fill()
+        self.background.paint(ctx)
 
         # paint the gauge bar itself
-        cur_rgb = self.gradient.lookup(val)
         cur_hsv = colorsys.rgb_to_hsv(*cur_rgb)
-        ctx.rectangle(self.x + self.padding, self.y + self.padding + self.gaugeh, self.w - self.padding * 2, -lerp(self.min, 0, self.max, self.gaugeh, val))
+        ctx.rectangle(self.x + self.padding, self.y + self.padding + self.gaugeh, self.w - self.padding * 2, -barh)
         if self.show_gradient:
             ctx.set_source(self.gradient.pattern)
             ctx.fill()
@@ -202,15 +223,8 @@ class GaugeVertical:
         ctx.fill()
 
         # paint the surround for the gauge cluster
-        ctx.rectangle(self.x + self.padding, self.y + self.padding, self.w - self.padding * 2, self.gaugeh)
-        ctx.set_line_width(4)
-        ctx.set_source_rgb(0, 0, 0)
-        ctx.stroke()
+        self.chrome.paint(ctx)
 
         # render the big numbers
-        text = self.label.format(val = val)
         self.label_text.color = colorsys.hsv_to_rgb(cur_hsv[0], 0.1, 1.0)
         self.label_text.render(ctx, text)
-
-        ctx.pop_group_to_source()
-        ctx.paint_with_alpha(0.9)
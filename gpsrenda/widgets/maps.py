@@ -29,6 +29,20 @@ class GaugeMap:
         self.minx, self.maxx = self.x + self.padding, self.x + self.w - self.padding
         self.miny, self.maxy = self.y + self.padding, self.y + self.h - self.padding
 
+        self.background = StaticLayer(self.x, self.y, self.w, self.h, self.draw_background)
+        self.tile = Tile(self.x, self.y, self.w, self.h)
+
+    def draw_background(self, ctx):
+        ctx.rectangle(self.x, self.y, self.w, self.h)
+        ctx.set_source(self.bgpattern)
+        ctx.fill()
+
+    def draw_map(self, ctx):
+        self.draw_background(ctx)
+
+        ctx.set_source_rgb(0.8, 0.8, 0.8)
+        ctx.mask_surface(self.mapsurface, self.x, self.y)
+
     def prerender(self, latdata, londata):
         logger.debug("... computing map bounds ...")
 
@@ -79,31 +93,31 @@ class GaugeMap:
 
         logger.debug(f"... rendered {npts} points ...")
 
+        self.maplayer = StaticLayer(self.x, self.y, self.w, self.h, self.draw_map)
+
     def render(self, ctx, lat, lon):
         if lat is None or lon is None:
-            ctx.push_group()
-            ctx.rectangle(self.x, self.y, self.w, self.h)
-            ctx.set_source(self.bgpattern)
-            ctx.fill()
-            ctx.pop_group_to_source()
-            ctx.paint_with_alpha(0.9)
+            self.tile.render(ctx, None, self.background.paint)
             return
 
-        ctx.push_group()
+        # The only thing that moves is the dot, so its position (to the
+        # nearest pixel) is the whole display key.
+        x = lerp(self.minlon, self.minx, self.maxlon, self.maxx, lon)
+        y = lerp(self.minlat, self.maxy, self.maxlat, self.miny, lat)
+        if np.isnan(x) or np.isnan(y):
+            key = (None, None)
+        else:
+            key = (round(x), round(y))
+        self.tile.render(ctx, key, lambda tctx: self.draw(tctx, *key))
 
-        # paint a background
-        ctx.rectangle(self.x, self.y, self.w, self.h)
-        ctx.set_source(self.bgpattern)
-        ctx.fill()
+    def draw(self, ctx, x, y):
+        # paint a background and the map
+        self.maplayer.paint(ctx)
 
-        # paint the map
-        ctx.set_source_rgb(0.8, 0.8, 0.8)
-        ctx.mask_surface(self.mapsurface, self.x, self.y)
+        if x is None:
+            return
 
         # paint a dot
-        x = lerp(self.minlon, self.minx, self.maxlon, self.maxx, lon)
-        y = lerp(self.minlat, self.maxy, self.maxlat, self.miny, lat)
-
         ctx.push_group()
 
         ctx.set_source_rgba(1.0, 1.0, 0.3, 0.5)
@@ -117,9 +131,6 @@ class GaugeMap:
         ctx.pop_group_to_source()
         ctx.paint_with_alpha(0.9)
 
-        ctx.pop_group_to_source()
-        ctx.paint_with_alpha(0.9)
-
 class GaugeElevationMap:
     def __init__(self, x, y, w = 400, h = 400, line_width = 5, dot_size = 15, dist_scale = 10, with_grade = True, with_elev = True, units = None, texth = None):
         self.x = x
@@ -160,6 +171,14 @@ class GaugeElevationMap:
 
         self.units = globals['units'] if units is None else units
 
+        self.background = StaticLayer(self.x, self.y, self.w, self.h, self.draw_background)
+        self.tile = Tile(self.x, self.y, self.w, self.h)
+
+    def draw_background(self, ctx):
+        ctx.rectangle(self.x, self.y, self.w, self.h)
+        ctx.set_source(self.bgpattern)
+        ctx.fill()
+
     def prerender(self, distdata, elevdata):
         logger.debug("... computing elevmap bounds ...")
 
@@ -208,21 +227,25 @@ class GaugeElevationMap:
         logger.debug(f"... rendered {npts} points ...")
 
     def render(self, ctx, dist, elev, grade):
-        if dist is None or elev is None:
-            ctx.push_group()
-            ctx.rectangle(self.x, self.y, self.w, self.h)
-            ctx.set_source(self.bgpattern)
-            ctx.fill()
-            ctx.pop_group_to_source()
-            ctx.paint_with_alpha(0.9)
+        if dist is None or elev is None or np.isnan(dist) or np.isnan(elev):
+            self.tile.render(ctx, None, self.background.paint)
             return
 
-        ctx.push_group()
+        # We only need to draw again if the map scrolls or the dot moves by
+        # a pixel, or if either of the labels change.
+        mapx = round(self.x - dist / self.dist_scale * self.w + self.w / 2)
+        doty = round(lerp(self.minelev, self.y + self.h - self.padding, self.maxelev, self.y + self.padding, elev))
+        if self.grade_text and grade is not False and not np.isnan(grade):
+            grade_label = f"{grade:.1f}%"
+        else:
+            grade_label = None
+        elev_label = f"{m_to_ft(elev):.0f}ft" if self.units == 'imperial' else f"{elev:.0f}m"
+        key = (mapx, doty, grade_label, elev_label)
+        self.tile.render(ctx, key, lambda tctx: self.draw(tctx, grade, *key))
 
+    def draw(self, ctx, grade, mapx, doty, grade_label, elev_label):
         # paint a background
-        ctx.rectangle(self.x, self.y, self.w, self.h)
-        ctx.set_source(self.bgpattern)
-        ctx.fill()
+        self.background.paint(ctx)
 
         # paint the map
         # XXX: clamp map position to [0, self.surfx]
@@ -230,12 +253,12 @@ class GaugeElevationMap:
         ctx.rectangle(self.x, self.y, self.w, self.h)
         ctx.clip()
         ctx.set_source(self.fgpattern)
-        ctx.mask_surface(self.mapsurface, self.x - dist / self.dist_scale * self.w + self.w / 2, self.y)
+        ctx.mask_surface(self.mapsurface, mapx, self.y)
         ctx.restore()
 
         # paint a dot
         x = self.x + self.w / 2
-        y = lerp(self.minelev, self.y + self.h - self.padding, self.maxelev, self.y + self.padding, elev)
+        y = doty
 
         ctx.push_group()
 
@@ -250,16 +273,12 @@ class GaugeElevationMap:
         ctx.pop_group_to_source()
         ctx.paint_with_alpha(0.9)
 
-        if self.grade_text and grade is not False and not np.isnan(grade):
+        if grade_label is not None:
             grade_hue = lerp(-5, 0.5, 10, 0.0, grade)
             self.grade_text.color = colorsys.hsv_to_rgb(grade_hue, 0.4, 0.9)
-            self.grade_text.render(ctx, f"{grade:.1f}%")
+            self.grade_text.render(ctx, grade_label)
 
-        elev_ft = m_to_ft(elev)
         if self.elev_text:
             self.elev_text.x = x
             self.elev_text.y = y + self.dot_size * 1.3
-            self.elev_text.render(ctx, f"{elev_ft:.0f}ft" if self.units == 'imperial' else f"{elev:.0f}m")
-
-        ctx.pop_group_to_source()
-        ctx.paint_with_alpha(0.9)
+            self.elev_text.render(ctx, elev_label)
@@ -0,0 +1,84 @@
+import time
+from importlib import import_module
+
+from gpsrenda.profiling import profiler
+
+class _TimedDataSource:
+    """Wraps a widget's data source, adding up how long the widget spends
+    asking it for data, so that can be told apart from drawing."""
+    def __init__(self, data_source):
+        self.data_source = data_source
+        self.elapsed = 0.0
+
+    def __getattr__(self, name):
+        if name == 'data_source':
+            raise AttributeError(name)
+        attr = getattr(self.data_source, name)
+        if not callable(attr):
+            return attr
+        def timed(*args, **kwargs):
+            tst = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                self.elapsed += time.perf_counter() - tst
+        return timed
+
+class Overlay:
+    """
+    All of the widgets drawn over a video.  Each widget keeps its own tile
+    (see Tile), so an overlay can either be painted straight onto a frame's
+    cairo context, or handed to an engine as a list of tiles, which it can
+    blend into only the rectangles of the frame that they cover.
+    """
+    def __init__(self, widgets):
+        self.widgets = widgets
+        self.names = [ type(widget).__name__.replace('Widget', '') for widget in widgets ]
+        if profiler.enabled:
+            for widget in widgets:
+                widget.data_source = _TimedDataSource(widget.data_source)
+
+    @classmethod
+    def from_config(cls, widget_specs, data_source):
+        """Builds the widgets described by the `widgets` section of a config
+        file."""
+        widget_module = import_module('gpsrenda.widgets.widgets')
+        widgets = []
+        for widget_spec in widget_specs:
+            widget_spec = dict(widget_spec)
+            try:
+                widget_type = widget_spec.pop('type')
+                widget_class = getattr(widget_module, widget_type+'Widget')
+                widget = widget_class(data_source=data_source, **widget_spec)
+                widgets.append(widget)
+            except Exception as e:
+                print(f"while trying to create a widget of type {widget_type}:")
+                raise
+        return cls(widgets)
+
+    def _render_widget(self, name, widget, ctx, t):
+        if not profiler.enabled:
+            widget.render(ctx, t)
+            return
+        widget.data_source.elapsed = 0.0
+        tst = time.perf_counter()
+        widget.render(ctx, t)
+        elapsed = time.perf_counter() - tst
+        profiler.record(f"widget/{name}/fetch", widget.data_source.elapsed)
+        profiler.record(f"widget/{name}/draw", elapsed - widget.data_source.elapsed)
+
+    def render(self, ctx, t):
+        for name, widget in zip(self.names, self.widgets):
+            self._render_widget(name, widget, ctx, t)
+
+    def tiles(self, t):
+        """Brings every widget's tile up to date for time t, and returns
+        the tiles, in the order in which they should be composited."""
+        for name, widget in zip(self.names, self.widgets):
+            self._render_widget(name, widget, None, t)
+        return [ widget.gauge.tile for widget in self.widgets ]
+
+    def stats(self):
+        """How often each widget got to reuse its last tile, as a list of
+        (name, hits, misses)."""
+        return [ (name, widget.gauge.tile.hits, widget.gauge.tile.misses) for name, widget in zip(self.names, self.widgets) ]
@@ -124,31 +124,35 @@ class GaugeText:
         
         self.bgpattern = make_background_pattern(0, self.y, 0, self.y + self.h)
 
-    def render(self, ctx, val):
-        if val is None:
-            ctx.push_group()
-            ctx.rectangle(self.x, self.y, self.w, self.h)
-            ctx.set_source(self.bgpattern)
-            ctx.fill()
-            ctx.pop_group_to_source()
-            ctx.paint_with_alpha(0.9)
-            return
+        self.label_text.color = (1.0, 1.0, 1.0)
+        self.caption_text.color = (1.0, 1.0, 1.0)
 
-        ctx.push_group()
+        self.background = StaticLayer(self.x, self.y, self.w, self.h, self.draw_background)
+        self.chrome = StaticLayer(self.x, self.y, self.w, self.h, self.draw_chrome)
+        self.tile = Tile(self.x, self.y, self.w, self.h)
 
-        # paint a background
+    def draw_background(self, ctx):
         ctx.rectangle(self.x, self.y, self.w, self.h)
         ctx.set_source(self.bgpattern)
         ctx.fill()
-        
-        if val is not None:
-            # render the big numbers
-            self.label_text.color = (1.0, 1.0, 1.0)
-            self.label_text.render(ctx, val)
-        
-            # render the little caption, if any
-            self.caption_text.color = (1.0, 1.0, 1.0)
-            self.caption_text.render(ctx, self.caption)
 
-        ctx.pop_group_to_source()
-        ctx.paint_with_alpha(0.9)
+    def draw_chrome(self, ctx):
+        self.draw_background(ctx)
+
+        # render the little caption, if any
+        self.caption_text.render(ctx, self.caption)
+
+    def render(self, ctx, val):
+        # The label is all that changes, so it is the whole display key.
+        self.tile.render(ctx, val, lambda tctx: self.draw(tctx, val))
+
+    def draw(self, ctx, val):
+        if val is None:
+            self.background.paint(ctx)
+            return
+
+        # paint a background and caption
+        self.chrome.paint(ctx)
+
+        # render the big numbers
+        self.label_text.render(ctx, val)
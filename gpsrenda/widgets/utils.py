@@ -1,5 +1,6 @@
 import cairo
 import colorsys
+import math
 import numpy as np
 
 from ..globals import globals
@@ -81,3 +82,107 @@ def make_background_pattern(x0, y0, x1, y1):
         pat.add_color_stop_rgba(0.0, 0.2, 0.2, 0.2, 0.9)
         pat.add_color_stop_rgba(1.0, 0.4, 0.4, 0.4, 0.9)
         return pat
+
+def pixel_bounds(x, y, w, h, margin = None):
+    """Returns the whole-pixel (x, y, w, h) of a surface that holds a widget
+    at (x, y, w, h), with some room around it for strokes, text, and
+    shadows that hang off of its edges.  Because the surface is placed on a
+    whole pixel, drawing into it rasterizes exactly as drawing in place."""
+    if margin is None:
+        margin = int(math.ceil(h / 4)) + 4
+    x0 = math.floor(x) - margin
+    y0 = math.floor(y) - margin
+    return (x0, y0, int(math.ceil(x + w)) + margin - x0, int(math.ceil(y + h)) + margin - y0)
+
+class StaticLayer:
+    """
+    The parts of a widget that never change (backgrounds, surrounds,
+    captions, ...), drawn once by `draw(ctx)` into an ARGB32 surface, so
+    that rendering a frame only has to paint the surface instead of drawing
+    them all again.  Like a Tile, the surface is drawn at the size that the
+    widget is shown at, so painting it into a tile is pixel for pixel.
+    """
+    def __init__(self, x, y, w, h, draw, margin = None):
+        self.scale = globals['style']['overlay_scale']
+        (self.x, self.y, width, height) = pixel_bounds(x * self.scale, y * self.scale, w * self.scale, h * self.scale,
+                                                       margin * self.scale if margin is not None else None)
+
+        self.surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+        ctx = cairo.Context(self.surface)
+        ctx.translate(-self.x, -self.y)
+        ctx.scale(self.scale, self.scale)
+        draw(ctx)
+        self.surface.flush()
+
+    def paint(self, ctx, alpha = 1.0):
+        # ctx is in the config file's coordinates, like the one that we drew
+        # into; undo its scale so that the surface lands on whole pixels.
+        if self.scale != 1.0:
+            ctx.save()
+            ctx.scale(1 / self.scale, 1 / self.scale)
+        ctx.set_source_surface(self.surface, self.x, self.y)
+        if alpha == 1.0:
+            ctx.paint()
+        else:
+            ctx.paint_with_alpha(alpha)
+        if self.scale != 1.0:
+            ctx.restore()
+
+class Tile:
+    """
+    A widget's most recently rendered image, kept in its own ARGB32 surface
+    along with the "display key" it was drawn for.  The key is something
+    cheap to compute that determines everything the widget shows (its label
+    text, its bar length in pixels, ...); as long as it stays the same from
+    one frame to the next, the widget is just composited from the tile,
+    without drawing anything.
+    """
+    def __init__(self, x, y, w, h, margin = None, alpha = 0.9):
+        # Widgets are laid out in the config file's coordinates, but the
+        # tile holds them at the size that they are shown at.
+        self.scale = globals['style']['overlay_scale']
+        (self.x, self.y, self.width, self.height) = pixel_bounds(x * self.scale, y * self.scale, w * self.scale, h * self.scale,
+                                                                 margin * self.scale if margin is not None else None)
+        self.surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.width, self.height)
+        self.alpha = alpha
+        self.key = None
+        self.valid = False
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def bounds(self):
+        return (self.x, self.y, self.width, self.height)
+
+    def render(self, ctx, key, draw):
+        """Brings the tile up to date for `key`, calling `draw(tile_ctx)` to
+        draw it again if it was last drawn for a different key, and then
+        paints it onto ctx.  If ctx is None, the tile is only brought up to
+        date, for callers that composite tiles themselves."""
+        if self.valid and key == self.key:
+            self.hits += 1
+        else:
+            # Draw into a new surface, rather than clearing the old one, so
+            # that snapshots of earlier frames stay intact.
+            self.surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.width, self.height)
+            tctx = cairo.Context(self.surface)
+            tctx.translate(-self.x, -self.y)
+            tctx.scale(self.scale, self.scale)
+            draw(tctx)
+            self.surface.flush()
+            self.key = key
+            self.valid = True
+            self.misses += 1
+
+        if ctx is not None:
+            self.paint(ctx)
+
+    def paint(self, ctx):
+        ctx.set_source_surface(self.surface, self.x, self.y)
+        ctx.paint_with_alpha(self.alpha)
+
+    def snapshot(self):
+        """Returns (surface, x, y, alpha) for the tile as it is now; the
+        surface is never drawn into again, so this can safely be painted
+        later, or from another thread."""
+        return (self.surface, self.x, self.y, self.alpha)
@@ -6,9 +6,9 @@ setup(
     description='Renda gauges onto video from a .fit file',
     author='Joshua Wise, Noah Young',
     packages=['gpsrenda'],
-    scripts=['gpsrenda/scripts/renda'],
+    scripts=['gpsrenda/scripts/renda', 'gpsrenda/scripts/gpsrenda-cache', 'gpsrenda/scripts/gpsrenda-bench'],
     install_requires=[
-        'fitparse',
+        'fitparse>=1.1,<2',
         'moviepy',
         'numpy',
         'pycairo',
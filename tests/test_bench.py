@@ -0,0 +1,44 @@
+import os
+
+import pytest
+import yaml
+
+pytest.importorskip("cairo")
+
+from gpsrenda import bench
+from gpsrenda.globals import globals
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), "..", "examples", "touring.yaml")
+
+@pytest.fixture(scope = "module")
+def layout():
+    with open(EXAMPLE, "r") as f:
+        config_data = yaml.safe_load(f)
+    return (config_data['widgets'], bench.synthetic_data_source(config_data.get('data', {}), duration = 600))
+
+def scales_seen(monkeypatch):
+    seen = []
+    from_config = bench.Overlay.from_config
+    def spy(specs, data_source):
+        seen.append(globals['style']['overlay_scale'])
+        return from_config(specs, data_source)
+    monkeypatch.setattr(bench.Overlay, "from_config", spy)
+    return seen
+
+def test_benchmark_draws_at_output_scale(layout, monkeypatch):
+    (widgets, data_source) = layout
+    seen = scales_seen(monkeypatch)
+    results = bench.benchmark(widgets, data_source, width = 3840, height = 2160, frames = 3, trace_allocations = False)
+    assert seen == [ 2.0 ]
+    assert globals['style']['overlay_scale'] == 1.0
+    assert len(results['widgets']) == len(widgets)
+    assert results['frames'] == 3
+
+def test_benchmark_restores_scale_on_error(layout, monkeypatch):
+    (widgets, data_source) = layout
+    def broken(specs, data_source):
+        raise RuntimeError("no widgets")
+    monkeypatch.setattr(bench.Overlay, "from_config", broken)
+    with pytest.raises(RuntimeError):
+        bench.benchmark(widgets, data_source, width = 1280, height = 720, frames = 1)
+    assert globals['style']['overlay_scale'] == 1.0
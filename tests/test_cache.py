@@ -0,0 +1,91 @@
+import json
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from gpsrenda.cache import evict
+from gpsrenda.datasources import CACHE_SUFFIX, ParsedFitData, load_fit_data
+
+def entry(directory, name, size, mtime):
+    path = directory / name
+    path.write_bytes(bytes(size))
+    os.utime(path, (mtime, mtime))
+    return path
+
+def test_evict_least_recently_used(tmp_path):
+    oldest = entry(tmp_path, "a.cache", 100, 1000)
+    middle = entry(tmp_path, "b.cache", 100, 2000)
+    newest = entry(tmp_path, "c.cache", 100, 3000)
+    evict(str(tmp_path), ".cache", 150)
+    assert not oldest.exists()
+    assert not middle.exists()
+    assert newest.exists()
+
+def test_evict_under_limit(tmp_path):
+    paths = [ entry(tmp_path, f"{i}.cache", 100, 1000 + i) for i in range(3) ]
+    evict(str(tmp_path), ".cache", 300)
+    assert all(path.exists() for path in paths)
+
+def test_evict_only_matching_suffix(tmp_path):
+    other = entry(tmp_path, "notes.txt", 1000, 0)
+    cached = entry(tmp_path, "a.cache", 100, 1000)
+    evict(str(tmp_path), ".cache", 0)
+    assert other.exists()
+    assert not cached.exists()
+
+def test_evict_keeps_keep(tmp_path):
+    kept = entry(tmp_path, "a.cache", 100, 1000)
+    other = entry(tmp_path, "b.cache", 100, 2000)
+    evict(str(tmp_path), ".cache", 100, keep = str(kept))
+    assert kept.exists()
+    assert not other.exists()
+
+def fake_parse(self, file_path):
+    self.version = ParsedFitData.VERSION
+    self.cache_key = None
+    self.file_id = { 'manufacturer': 'test' }
+    self.fields = { 'speed': np.array([ [ 0.0, 1.0 ], [ 1.0, 2.0 ] ]), 'lap': np.empty((0, 2)) }
+
+def header(**fields):
+    data = json.dumps(fields).encode('utf-8')
+    return ParsedFitData.CACHE_MAGIC + struct.pack("<Q", len(data)) + data
+
+TRUNCATED = [
+    ParsedFitData.CACHE_MAGIC + b"\x01\x02",
+    ParsedFitData.CACHE_MAGIC + struct.pack("<Q", 100) + b"{}",
+    header(file_id = {}, columns = []),
+    header(version = ParsedFitData.VERSION, file_id = {}),
+    header(version = ParsedFitData.VERSION, file_id = {}, columns = [ [ 'speed', 0, 1000 ] ]),
+    header(version = ParsedFitData.VERSION, file_id = {}, columns = [ 'speed' ]),
+]
+
+@pytest.mark.parametrize('contents', TRUNCATED)
+def test_load_cache_rejects_truncated_entries(tmp_path, contents):
+    path = tmp_path / ("entry" + CACHE_SUFFIX)
+    path.write_bytes(contents)
+    with pytest.raises(ValueError):
+        ParsedFitData.load_cache(str(path))
+
+def test_cache_round_trips(tmp_path, monkeypatch):
+    monkeypatch.setattr(ParsedFitData, "__init__", fake_parse)
+    path = str(tmp_path / ("entry" + CACHE_SUFFIX))
+    ParsedFitData("ride.fit").save_cache(path)
+    loaded = ParsedFitData.load_cache(path)
+    assert loaded.file_id == { 'manufacturer': 'test' }
+    np.testing.assert_array_equal(loaded.fields['speed'], [ [ 0.0, 1.0 ], [ 1.0, 2.0 ] ])
+    assert loaded.fields['lap'].shape == (0, 2)
+
+def test_truncated_entry_is_parsed_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(ParsedFitData, "__init__", fake_parse)
+    fit = tmp_path / "ride.fit"
+    fit.write_bytes(b"not really a FIT file")
+    load_fit_data(str(fit), cache_dir = str(tmp_path))
+    (entry, ) = tmp_path.glob("*" + CACHE_SUFFIX)
+    entry.write_bytes(TRUNCATED[0])
+
+    parsed = load_fit_data(str(fit), cache_dir = str(tmp_path))
+    np.testing.assert_array_equal(parsed.fields['speed'], [ [ 0.0, 1.0 ], [ 1.0, 2.0 ] ])
+    # ... and the entry has been written again.
+    assert ParsedFitData.load_cache(str(entry)).file_id == { 'manufacturer': 'test' }
@@ -0,0 +1,84 @@
+import math
+
+import numpy as np
+import pytest
+
+from gpsrenda.datasources import PrecomputedDataSource, interp1d_zeroing, interp1d_zeroing_array
+
+def assert_agrees(x, y, ts, flatten_time = math.inf):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    expected = [ interp1d_zeroing(x, y, t, flatten_time) for t in ts ]
+    np.testing.assert_array_equal(interp1d_zeroing_array(x, y, ts, flatten_time), expected)
+
+def test_interp_matches_scalar():
+    x = [ 0.0, 1.0, 2.0, 5.0, 6.0 ]
+    y = [ 10.0, 20.0, 40.0, 10.0, -5.0 ]
+    assert_agrees(x, y, np.linspace(-1.0, 7.0, 81))
+
+def test_interp_matches_scalar_at_boundaries():
+    x = [ 0.0, 1.0, 2.0 ]
+    y = [ 3.0, 4.0, 5.0 ]
+    assert_agrees(x, y, [ 0.0, 2.0, -1e-9, 2.0 + 1e-9, 1.0 ])
+
+def test_interp_matches_scalar_with_flattening():
+    x = [ 0.0, 1.0, 10.0, 11.0, 30.0 ]
+    y = [ 1.0, 2.0, 3.0, 4.0, 5.0 ]
+    assert_agrees(x, y, np.linspace(-1.0, 31.0, 321), flatten_time = 2.0)
+
+@pytest.mark.parametrize('t', [ 4.0, 3.0, 5.0 ])
+def test_interp_single_sample(t):
+    assert_agrees([ 4.0 ], [ 7.0 ], [ t ])
+
+def test_interp_single_sample_value():
+    out = interp1d_zeroing_array(np.array([ 4.0 ]), np.array([ 7.0 ]), [ 3.0, 4.0, 5.0 ])
+    assert math.isnan(out[0]) and out[1] == 7.0 and math.isnan(out[2])
+
+class FakeDataSource:
+    """Has speed (twice the time) and nothing else; remembers which times
+    it was asked about one at a time."""
+    def __init__(self):
+        self.scalar_calls = []
+
+    def sample(self, fields, times):
+        if list(fields) != [ 'speed' ]:
+            raise KeyError(fields[0])
+        return { 'speed': np.asarray(times) * 2.0 }
+
+    def speed(self, t):
+        self.scalar_calls.append(t)
+        return t * 2.0
+
+    def power(self, t):
+        raise KeyError('power')
+
+def precomputed():
+    source = FakeDataSource()
+    table = PrecomputedDataSource(source)
+    table.precompute(start = 100.0, duration = 2.0, framerate = 10.0)
+    return (source, table)
+
+def test_lookup_uses_nearest_row():
+    (source, table) = precomputed()
+    assert table.nframes == 21
+    assert table.speed(100.0) == 200.0
+    assert table.speed(100.51) == 2.0 * 100.5
+    assert table.speed(100.54) == 2.0 * 100.5
+    assert table.speed(102.0) == 204.0
+    assert source.scalar_calls == []
+
+def test_lookup_falls_through_outside_table():
+    (source, table) = precomputed()
+    assert table.speed(99.0) == 198.0
+    assert table.speed(103.0) == 206.0
+    assert source.scalar_calls == [ 99.0, 103.0 ]
+
+def test_lookup_missing_channel_raises():
+    (_, table) = precomputed()
+    with pytest.raises(KeyError):
+        table.power(101.0)
+
+def test_lookup_before_precompute_falls_through():
+    source = FakeDataSource()
+    assert PrecomputedDataSource(source).speed(5.0) == 10.0
+    assert source.scalar_calls == [ 5.0 ]
@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip("gi")
+pytest.importorskip("cairo")
+
+from gpsrenda.video.gstreamer import Gst, RenderEngineGstreamer
+
+def quiet_engine():
+    engine = RenderEngineGstreamer(None)
+    engine.set_progress(lambda pos, dur, piece = None: None)
+    return engine
+
+def test_run_raises_on_pipeline_error(tmp_path):
+    pipeline = Gst.parse_launch(f"filesrc location={tmp_path / 'missing.mp4'} ! fakesink")
+    with pytest.raises(RuntimeError, match = "pipeline reported an error"):
+        quiet_engine()._run(pipeline)
+
+def test_run_finishes_at_eos():
+    pipeline = Gst.parse_launch("fakesrc num-buffers=10 ! fakesink")
+    assert quiet_engine()._run(pipeline) >= 0
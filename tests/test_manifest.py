@@ -0,0 +1,63 @@
+import os
+
+from gpsrenda.manifest import MANIFEST_NAME, Manifest, fingerprint
+
+def make_inputs(video_path, mode = 'video', offset = 3):
+    return fingerprint("config-digest", "fit-key", { 'offset': offset, 'tweaks': { 'scale': '1920x1080' } }, str(video_path), mode)
+
+def test_fingerprint_round_trips(tmp_path):
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"video")
+    output = tmp_path / "out.mp4"
+    output.write_bytes(b"rendered")
+
+    manifest = Manifest(tmp_path)
+    manifest.start("out.mp4", make_inputs(video), str(output))
+    manifest.finish("out.mp4", { 'output': str(output), 'duration': 1.0, 'frames': 30, 'elapsed': 0.5 })
+
+    reloaded = Manifest(tmp_path)
+    assert reloaded.up_to_date("out.mp4", make_inputs(video))
+    assert not reloaded.stale("out.mp4", make_inputs(video))
+
+def test_changed_inputs_are_stale(tmp_path):
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"video")
+    output = tmp_path / "out.mp4"
+    output.write_bytes(b"rendered")
+
+    manifest = Manifest(tmp_path)
+    manifest.start("out.mp4", make_inputs(video), str(output))
+    manifest.finish("out.mp4", { 'output': str(output), 'duration': 1.0, 'frames': 30, 'elapsed': 0.5 })
+
+    for changed in (make_inputs(video, offset = 4), make_inputs(video, mode = 'overlay')):
+        assert not manifest.up_to_date("out.mp4", changed)
+        assert manifest.stale("out.mp4", changed)
+
+    # Touching the source changes its fingerprint, too.
+    video.write_bytes(b"new video")
+    os.utime(video, (0, 0))
+    assert manifest.stale("out.mp4", make_inputs(video))
+
+def test_unfinished_or_missing_output_is_not_up_to_date(tmp_path):
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"video")
+    output = tmp_path / "out.mp4"
+
+    manifest = Manifest(tmp_path)
+    manifest.start("out.mp4", make_inputs(video), str(output))
+    assert not manifest.up_to_date("out.mp4", make_inputs(video))
+    assert not manifest.stale("out.mp4", make_inputs(video))
+
+    manifest.finish("out.mp4", { 'output': str(output), 'duration': 1.0, 'frames': 30, 'elapsed': 0.5 })
+    assert not manifest.up_to_date("out.mp4", make_inputs(video))
+
+def test_unknown_entry(tmp_path):
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"video")
+    manifest = Manifest(tmp_path)
+    assert not manifest.up_to_date("out.mp4", make_inputs(video))
+    assert not manifest.stale("out.mp4", make_inputs(video))
+
+def test_unreadable_manifest_renders_everything(tmp_path):
+    (tmp_path / MANIFEST_NAME).write_text("{ not json")
+    assert Manifest(tmp_path).entries == {}
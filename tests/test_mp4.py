@@ -0,0 +1,89 @@
+import struct
+from datetime import datetime
+from fractions import Fraction
+
+import pytest
+
+from gpsrenda import mp4
+
+def box(kind, *payload):
+    payload = b"".join(payload)
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+def full_box(kind, *payload, version = 0):
+    return box(kind, struct.pack(">B3x", version), *payload)
+
+def matrix(a, b):
+    return struct.pack(">9i", a, b, 0, -b, a, 0, 0, 0, 0x40000000)
+
+def video_track(rotation_matrix = (0x10000, 0), format = b'avc1', width = 1920, height = 1080, timescale = 30000, stts = ((300, 1001), )):
+    sample_entry = box(format, bytes(24), struct.pack(">HH", width, height), bytes(50))
+    return box(b'trak',
+        full_box(b'tkhd', struct.pack(">IIIII", 0, 0, 1, 0, 0), bytes(16), matrix(*rotation_matrix), bytes(8)),
+        box(b'mdia',
+            full_box(b'mdhd', struct.pack(">IIII", 0, 0, timescale, sum(n * d for n, d in stts)), bytes(4)),
+            full_box(b'hdlr', bytes(4), b'vide', bytes(12)),
+            box(b'minf',
+                box(b'stbl',
+                    full_box(b'stsd', struct.pack(">I", 1), sample_entry),
+                    full_box(b'stts', struct.pack(">I", len(stts)), *(struct.pack(">II", n, d) for n, d in stts))))))
+
+def sound_track():
+    return box(b'trak', box(b'mdia', full_box(b'hdlr', bytes(4), b'soun', bytes(12))))
+
+CREATED = int((datetime(2021, 6, 1, 8, 30, 0) - mp4.EPOCH).total_seconds())
+
+def movie(*tracks, duration = 10010, timescale = 1000):
+    return box(b'moov', full_box(b'mvhd', struct.pack(">IIII", CREATED, CREATED, timescale, duration), bytes(80)), *tracks)
+
+def write(tmp_path, *boxes, name = "clip.mp4"):
+    path = tmp_path / name
+    path.write_bytes(b"".join(boxes))
+    return str(path)
+
+def test_probe(tmp_path):
+    path = write(tmp_path, box(b'ftyp', b'isom', bytes(4)), box(b'mdat', bytes(100)), movie(sound_track(), video_track()))
+    info = mp4.probe(path)
+    assert info.creation_time == datetime(2021, 6, 1, 8, 30, 0)
+    assert info.duration == pytest.approx(10.01)
+    assert info.rotation == 0
+    assert info.codec == 'h264'
+    assert (info.width, info.height) == (1920, 1080)
+    assert info.framerate == Fraction(30000, 1001)
+
+@pytest.mark.parametrize('rotation_matrix, rotation', [ ((0, 0x10000), 90), ((-0x10000, 0), 180), ((0, -0x10000), 270) ])
+def test_probe_rotation(tmp_path, rotation_matrix, rotation):
+    path = write(tmp_path, movie(video_track(rotation_matrix = rotation_matrix)))
+    assert mp4.probe(path).rotation == rotation
+
+def test_probe_codecs(tmp_path):
+    assert mp4.probe(write(tmp_path, movie(video_track(format = b'hvc1')), name = "a.mp4")).codec == 'h265'
+    assert mp4.probe(write(tmp_path, movie(video_track(format = b'mp4v')), name = "b.mp4")).codec == 'mp4v'
+
+def test_probe_variable_frame_durations(tmp_path):
+    path = write(tmp_path, movie(video_track(timescale = 600, stts = ((10, 20), (10, 10)))))
+    assert mp4.probe(path).framerate == Fraction(600 * 20, 300)
+
+def test_probe_fragmented_duration(tmp_path):
+    # Fragmented files leave the movie's duration blank.
+    path = write(tmp_path, movie(video_track(), duration = 0))
+    assert mp4.probe(path).duration == pytest.approx(300 * 1001 / 30000)
+
+def test_probe_large_box(tmp_path):
+    mdat = struct.pack(">I4sQ", 1, b'mdat', 16 + 100) + bytes(100)
+    path = write(tmp_path, mdat, movie(video_track()))
+    assert mp4.probe(path).width == 1920
+
+def test_probe_errors(tmp_path):
+    with pytest.raises(ValueError, match = "no moov box"):
+        mp4.probe(write(tmp_path, box(b'mdat', bytes(16)), name = "a.mp4"))
+    with pytest.raises(ValueError, match = "no video track"):
+        mp4.probe(write(tmp_path, movie(sound_track()), name = "b.mp4"))
+    with pytest.raises(ValueError, match = "malformed"):
+        mp4.probe(write(tmp_path, box(b'moov', struct.pack(">I4s", 4, b'mvhd')), name = "c.mp4"))
+    with pytest.raises(ValueError, match = "truncated"):
+        mp4.probe(write(tmp_path, box(b'moov', full_box(b'mvhd', bytes(4))), name = "d.mp4"))
+
+def test_boxes():
+    data = box(b'free', b'abcd') + box(b'skip')
+    assert list(mp4._boxes(data)) == [ (b'free', 8, 12), (b'skip', 20, 20) ]
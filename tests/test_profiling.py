@@ -0,0 +1,21 @@
+import json
+
+from gpsrenda.profiling import Profiler, combine_dumps
+from gpsrenda.globals import globals
+
+def test_combine_dumps(tmp_path, monkeypatch):
+    monkeypatch.setitem(globals, 'profile', True)
+    paths = []
+    for i in range(2):
+        profiler = Profiler()
+        profiler.record("overlay/frame", float(i))
+        paths.append(str(tmp_path / f"piece{i}.profile.json"))
+        profiler.dump(paths[-1])
+    # A piece that was rendered by an earlier run has no profile.
+    paths.append(str(tmp_path / "piece2.profile.json"))
+
+    combine_dumps(paths, str(tmp_path / "clip.profile.json"))
+    with open(tmp_path / "clip.profile.json") as f:
+        combined = json.load(f)
+    assert [ piece and piece['overlay/frame']['max'] for piece in combined['pieces'] ] == [ 0.0, 1.0, None ]
+    assert sorted(p.name for p in tmp_path.iterdir()) == [ "clip.profile.json" ]
@@ -0,0 +1,61 @@
+import os
+
+from gpsrenda.video.segments import PieceProcess, split_points
+
+def test_split_points_without_keyframes():
+    assert split_points(90.0, [], 3) == [ (0, 30.0), (30.0, 60.0), (60.0, None) ]
+
+def test_split_points_snaps_to_keyframes():
+    keyframes = [ 0.0, 8.0, 17.0, 26.0, 35.0, 44.0, 53.0, 62.0 ]
+    assert split_points(64.0, keyframes, 4) == [ (0, 17.0), (17.0, 35.0), (35.0, 44.0), (44.0, None) ]
+
+def test_split_points_drops_repeated_cuts():
+    # Every target is nearest to the one keyframe, so there is only one cut.
+    assert split_points(60.0, [ 0.0, 29.0 ], 4) == [ (0, 29.0), (29.0, None) ]
+
+def test_split_points_one_segment():
+    assert split_points(60.0, [ 0.0, 10.0 ], 1) == [ (0, None) ]
+
+class FakeEngine:
+    """Writes what it was asked to render into dest, instead of a video."""
+    def set_tweaks(self, tweaks):
+        self.tweaks = tweaks
+
+    def set_inputs(self, inputs):
+        self.inputs = inputs
+
+    def set_progress(self, progress):
+        self.progress = progress
+
+    def _render_one(self, src, dest, segment = None, label = ""):
+        if src == "missing.mp4":
+            raise FileNotFoundError(src)
+        self.progress(1.5, 3.0)
+        with open(dest, "w") as f:
+            f.write(f"{src} {segment} {self.tweaks} {self.inputs}")
+
+def job(tmp_path, src = "clip.mp4"):
+    return {
+        'factory': FakeEngine,
+        'globals': {},
+        'log_level': 30,
+        'tweaks': { 'offset': 2 },
+        'inputs': 'abc',
+        'src': src,
+        'dest': str(tmp_path / "piece.mp4"),
+        'segment': (10.0, 20.0),
+        'label': "[1/2] ",
+    }
+
+def test_piece_process_renders_piece(tmp_path):
+    progress = []
+    child = PieceProcess(job(tmp_path), lambda pos, dur: progress.append((pos, dur)))
+    assert child.wait()
+    assert progress == [ (1.5, 3.0) ]
+    assert (tmp_path / "piece.mp4").read_text() == "clip.mp4 (10.0, 20.0) {'offset': 2} abc"
+    assert not os.path.exists(tmp_path / "piece.mp4.partial")
+
+def test_piece_process_reports_failure(tmp_path):
+    child = PieceProcess(job(tmp_path, src = "missing.mp4"))
+    assert not child.wait()
+    assert not os.path.exists(tmp_path / "piece.mp4")
@@ -0,0 +1,45 @@
+import multiprocessing as mp
+
+import pytest
+
+pytest.importorskip("cairo")
+
+from gpsrenda.session import init_batch_worker, render_batch_clip
+
+class FakeEngine:
+    """Renders by reporting some progress, and failing for 'bad.mp4'."""
+    def set_tweaks(self, tweaks):
+        pass
+
+    def set_inputs(self, inputs):
+        pass
+
+    def set_factory(self, factory):
+        pass
+
+    def set_progress(self, progress):
+        self.progress = progress
+
+    def render(self, src, dest):
+        if src == "bad.mp4":
+            raise ValueError("cannot render bad.mp4")
+        self.progress(1.0, 2.0)
+        return { 'output': dest, 'duration': 2.0, 'frames': 60, 'elapsed': 0.1 }
+
+def job(i, src):
+    return { 'index': i, 'factory': FakeEngine, 'globals': {}, 'tweaks': {}, 'inputs': None, 'src': src, 'dest': src + ".out", 'overlay_only': False }
+
+def test_batch_workers_are_fresh_processes():
+    ctx = mp.get_context('spawn')
+    progress = ctx.Queue()
+    with ctx.Pool(processes = 2, initializer = init_batch_worker, initargs = (progress, 30)) as pool:
+        good = pool.apply_async(render_batch_clip, (job(0, "good.mp4"), ))
+        bad = pool.apply_async(render_batch_clip, (job(1, "bad.mp4"), ))
+        assert good.get(timeout = 60)['output'] == "good.mp4.out"
+        with pytest.raises(ValueError):
+            bad.get(timeout = 60)
+
+    reports = set()
+    for _ in range(3):
+        reports.add(progress.get(timeout = 10))
+    assert reports == { (0, None, 1.0, 2.0), (0, None, None, None), (1, None, None, None) }
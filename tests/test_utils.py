@@ -0,0 +1,43 @@
+from fractions import Fraction
+
+import numpy as np
+import pytest
+
+from gpsrenda.datasources import PrecomputedDataSource
+from gpsrenda.utils import snap_to_frame
+
+NTSC = Fraction(30000, 1001)
+
+def test_snap_to_frame_exact():
+    assert snap_to_frame(0.0, NTSC) == (0, 0.0)
+    assert snap_to_frame(1001 / 30000 * 7, NTSC) == (7, 7 / NTSC)
+
+@pytest.mark.parametrize('jitter', [ -0.4, -0.1, 0.1, 0.4 ])
+def test_snap_to_frame_jitter(jitter):
+    # Timestamps that are off by less than half a frame land in the slot.
+    (k, pos) = snap_to_frame((1000 + jitter) / NTSC, NTSC)
+    assert k == 1000
+    assert pos == 1000 / NTSC
+
+def test_snap_to_frame_float_framerate():
+    assert snap_to_frame(2.01, 25.0) == (50, 2.0)
+
+def test_snap_to_frame_unknown_framerate():
+    assert snap_to_frame(1.234, None) == (None, 1.234)
+    assert snap_to_frame(1.234, 0) == (None, 1.234)
+
+class RowSource:
+    """Every sample is the time it was asked for."""
+    def sample(self, fields, times):
+        if list(fields) != [ 'speed' ]:
+            raise KeyError(fields[0])
+        return { 'speed': np.asarray(times) }
+
+def test_snapped_times_hit_precomputed_rows():
+    start = 1000.0
+    table = PrecomputedDataSource(RowSource())
+    table.precompute(start, 600 / float(NTSC), float(NTSC))
+    for k in range(0, 600, 7):
+        (frame, pos) = snap_to_frame((k + 0.3) / NTSC, NTSC)
+        assert frame == k
+        assert table.speed(start + pos) == start + k / float(NTSC)